@@ -0,0 +1,481 @@
+"""Benchmarks the part1.py and part2.py pipelines on synthetic inventories.
+
+For each inventory size the three input files are generated with a skewed mix of
+manufacturers, item types, damage, prices and service dates, and the stages the command line
+runs are run in turn through the same functions: loading the inventory from the streamed
+files and writing each report, with the dictionary and the columnar store, writing the
+reports with --jobs, and for part2 each kind of query, a batch of queries, and saving and
+reopening a snapshot. Each stage is timed over several passes, and its peak memory is
+measured in a last pass under tracemalloc so that tracing does not slow down the timed ones.
+
+Results can be saved as a baseline and compared with later runs. Timings are compared by
+their median over the passes. A stage is a regression when its median grows by more than the
+tolerance plus the noise of the two runs: the relative spread of their passes, and never less
+than NOISE_FLOOR. Slowdowns of a few milliseconds are ignored as jitter. A stage is also a
+regression when it used more memory than the baseline allows, or when its output changed
+size. Any regression makes the benchmark exit with status 1.
+
+    python benchmark.py --items 10k 1M --save-baseline baseline.json
+    python benchmark.py --items 10k 1M --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import part1
+import part2
+import service_dates
+from columnar_inventory import ColumnarInventory
+from inventory_snapshot import source_stats
+from parallel_reports import write_reports_in_parallel
+
+SOURCES = ("ManufacturerList.txt", "PriceList.txt", "ServiceDatesList.txt")
+QUERY_FILE = "queries.txt"  # Queries answered by the batch stages, one per line
+SNAPSHOT_FILE = "inventory.snapshot"
+STORAGES = {"dict": None, "columnar": ColumnarInventory}  # Inventory store of each --storage; the columnar stages are named so
+
+# Manufacturers and item types, most common first; their shares fall off as 1 / rank ** SKEW
+MANUFACTURERS = ("Dell", "HP", "Lenovo", "Apple", "Acer", "Asus", "Samsung", "Microsoft", "Toshiba", "Sony",
+                 "Fujitsu", "Razer")
+ITEM_TYPES = ("laptop", "phone", "tower", "tablet", "monitor", "printer")
+SKEW = 1.1
+DAMAGE_RATE = 0.03  # Share of damaged items
+MISSING_RATE = 0.02  # Share of items left out of the price list, and of the service dates list
+PAST_RATE = 0.2  # Share of service dates that have already passed
+BASE_PRICES = {"laptop": 900, "phone": 600, "tower": 1200, "tablet": 450, "monitor": 250, "printer": 180}
+
+WRITE_LINES = 1 << 16  # Lines generated before they are written out
+ID_BASE = 10_000_000  # Item IDs are eight digits: ID_BASE plus a permuted row number
+ID_SPACE = 90_000_000
+ID_STRIDE = 7_919_113  # Coprime with ID_SPACE, so the IDs of rows below ID_SPACE never repeat
+
+NOISE_FLOOR = 0.05  # Least relative noise assumed of a median time, however steady its passes
+RESOLUTION_SECONDS = 0.005  # Slowdowns smaller than this are scheduling jitter, never regressions
+NOISE_BYTES = 1 << 16  # Memory increases smaller than this are never regressions
+DEFAULT_TOLERANCE = 0.25  # Allowed growth over the baseline, as a fraction
+DEFAULT_REPEAT = 5  # Timed passes per size
+DEFAULT_JOBS = 2  # Worker processes of the parallel report stages
+
+
+def parse_count(text):
+    """Converts an item count such as 5000, 10k or 2M into an integer."""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    text = text.strip().lower()
+    if text[-1:] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def skewed_weights(names):
+    """Returns cumulative weights that make earlier names more common."""
+    total = 0.0
+    cumulative = []
+    for rank in range(len(names)):
+        total += 1 / (rank + 1) ** SKEW
+        cumulative.append(total)
+    return cumulative
+
+
+def coprime_stride(count, start):
+    """Returns a stride coprime with count, so that row * stride % count visits every row once."""
+    stride = start % count or 1
+    while math.gcd(stride, count) != 1:
+        stride += 1
+    return stride
+
+
+def write_lines(path, count, line):
+    """Writes line(row) for every row below count to a file, in blocks."""
+    with open(path, 'w') as file:
+        for start in range(0, count, WRITE_LINES):
+            file.write(''.join(line(row) for row in range(start, min(count, start + WRITE_LINES))))
+
+
+def generate_inventory(directory, count, seed=1, today=None):
+    """Writes the three input files for count items into a directory.
+
+    Service dates are spread around today, so each size has the same share of past dates
+    whichever day it runs. The price and service date lists name the items in different
+    orders from the manufacturer list, as real exports do.
+    """
+    if count > ID_SPACE:
+        raise ValueError(f"at most {ID_SPACE} items can be generated")
+    today = (today or datetime.date.today()).toordinal()
+    generator = random.Random(seed)
+    manufacturer_weights = skewed_weights(MANUFACTURERS)
+    type_weights = skewed_weights(ITEM_TYPES)
+
+    def item_id(row):
+        return ID_BASE + row * ID_STRIDE % ID_SPACE
+
+    types = []  # Item type of each row, for pricing
+    def manufacturer_line(row):
+        manufacturer, = generator.choices(MANUFACTURERS, cum_weights=manufacturer_weights)
+        item_type, = generator.choices(ITEM_TYPES, cum_weights=type_weights)
+        types.append(item_type)
+        damaged = ",damaged" if generator.random() < DAMAGE_RATE else ""
+        return f"{item_id(row)},{manufacturer},{item_type}{damaged}\n"
+
+    price_stride = coprime_stride(count, 7_368_787)
+    def price_line(position):
+        row = position * price_stride % count
+        if generator.random() < MISSING_RATE:
+            return ""
+        return f"{item_id(row)},{max(1, round(BASE_PRICES[types[row]] * generator.lognormvariate(0, 0.4)))}\n"
+
+    date_stride = coprime_stride(count, 5_915_587)
+    def service_date_line(position):
+        row = position * date_stride % count
+        if generator.random() < MISSING_RATE:
+            return ""
+        days = -generator.randint(1, 3 * 365) if generator.random() < PAST_RATE else generator.randint(1, 3 * 365)
+        date = datetime.date.fromordinal(today + days)
+        return f"{item_id(row)},{date.month}/{date.day}/{date.year}\n"
+
+    write_lines(os.path.join(directory, SOURCES[0]), count, manufacturer_line)
+    write_lines(os.path.join(directory, SOURCES[1]), count, price_line)
+    write_lines(os.path.join(directory, SOURCES[2]), count, service_date_line)
+
+
+def make_queries(count, seed=1):
+    """Returns count query texts, mostly "manufacturer item type" in the generated mix, some misspelled or unknown."""
+    generator = random.Random(seed)
+    manufacturer_weights = skewed_weights(MANUFACTURERS)
+    type_weights = skewed_weights(ITEM_TYPES)
+    queries = []
+    for _ in range(count):
+        manufacturer, = generator.choices(MANUFACTURERS, cum_weights=manufacturer_weights)
+        item_type, = generator.choices(ITEM_TYPES, cum_weights=type_weights)
+        roll = generator.random()
+        if roll < 0.1:  # Drops a letter of the manufacturer
+            position = generator.randrange(len(manufacturer))
+            manufacturer = manufacturer[:position] + manufacturer[position + 1:]
+        elif roll < 0.15:
+            manufacturer = "Nokia"  # Not in the inventory
+        queries.append(f"{manufacturer.lower()} {item_type}" if generator.random() < 0.5
+                       else f"I need a {manufacturer} {item_type} please")
+    return queries
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Runs the body of a with statement in another directory, where the reports get written."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def link_inputs(data, directory):
+    """Makes the generated input files available in a directory, where the pipelines read them by name."""
+    os.makedirs(directory, exist_ok=True)
+    for filename in SOURCES + (QUERY_FILE,):
+        target = os.path.join(directory, filename)
+        if not os.path.exists(target):
+            try:
+                os.link(os.path.join(data, filename), target)
+            except OSError:  # The file system has no hard links
+                shutil.copyfile(os.path.join(data, filename), target)
+
+
+def clear_caches():
+    """Empties the service date caches, so that each run loads as a new process would."""
+    service_dates.is_service_date.cache_clear()
+    service_dates.parse_service_date.cache_clear()
+    service_dates.format_service_date.cache_clear()
+
+
+def count_lines(*paths):
+    """Returns the total number of lines in the files."""
+    total = 0
+    for path in paths:
+        with open(path, 'rb') as file:
+            total += sum(block.count(b"\n") for block in iter(lambda: file.read(1 << 20), b""))
+    return total
+
+
+class Recorder:
+    """Runs pipeline stages and records their time, or their peak memory when tracing."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory  # Measures peak memory instead of time
+        self.results = {}  # Maps stage name to its measurements
+
+    def run(self, name, function, **counts):
+        """Runs a stage, records its measurements and the given counts, and returns its result."""
+        gc.collect()  # Leaves garbage from earlier stages out of this one
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        record = self.results.setdefault(name, {})
+        if self.trace_memory:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+        else:
+            record['seconds'] = elapsed
+        record.update(counts)
+        return result
+
+
+def run_part1(recorder, directory, queries=(), jobs=DEFAULT_JOBS):
+    """Runs the part1.py stages in the run directories under directory, where the reports get written.
+
+    part1.py answers no queries, so queries is unused.
+    """
+    for storage, store in STORAGES.items():
+        clear_caches()
+        with working_directory(os.path.join(directory, f"part1-{storage}")):
+            stage = "part1." if store is None else f"part1.{storage}."
+            inventory = recorder.run(stage + "load_inventory", lambda: part1.LoadTheInventory(store and store()))
+            recorder.results[stage + "load_inventory"]['rows'] = len(inventory)
+            views = part1.views_for(inventory)  # Shared as in main(), so the first report sorts the items
+            recorder.run(stage + "full_inventory", lambda: part1.FullInventory(inventory, views))
+            recorder.run(stage + "item_type_inventory", lambda: part1.ItemTypeInventory(inventory, views))
+            recorder.run(stage + "past_service_date_inventory", lambda: part1.PastServiceDateInventory(inventory, views))
+            recorder.run(stage + "damaged_inventory", lambda: part1.DamagedInventory(inventory, views))
+            report_lines(recorder, stage, {
+                "full_inventory": ["FullInventory.txt"],
+                "item_type_inventory": part1.ItemTypeFiles(views),
+                "past_service_date_inventory": ["PastServiceDateInventory.txt"],
+                "damaged_inventory": ["DamagedInventory.txt"],
+            })
+
+    clear_caches()
+    with working_directory(os.path.join(directory, "part1-jobs")):
+        inventory = part1.LoadTheInventory()
+        recorder.run("part1.write_reports_in_parallel", lambda: write_reports_in_parallel(inventory, part1.REPORT_LINES, jobs))
+        report_lines(recorder, "part1", {
+            "write_reports_in_parallel": list(part1.REPORT_FILES) + part1.ItemTypeFiles(part1.views_for(inventory)),
+        })
+
+
+def run_part2(recorder, directory, queries=(), jobs=DEFAULT_JOBS):
+    """Runs the part2.py stages in the run directories under directory, then answers the queries each way."""
+    for storage, store in STORAGES.items():
+        clear_caches()
+        with working_directory(os.path.join(directory, f"part2-{storage}")):
+            stage = "part2." if store is None else f"part2.{storage}."
+            manager = part2.InventoryManager(store and store())
+            recorder.run(stage + "load_inventory", manager.load_inventory)
+            recorder.results[stage + "load_inventory"]['rows'] = len(manager.inventory)
+            recorder.run(stage + "full_inventory", manager.full_inventory)
+            recorder.run(stage + "item_type_inventory", manager.item_type_inventory)
+            recorder.run(stage + "past_service_date_inventory", manager.past_service_date_inventory)
+            recorder.run(stage + "damaged_inventory", manager.damaged_inventory)
+            report_lines(recorder, stage, {
+                "full_inventory": ["FullInventory.txt"],
+                "item_type_inventory": manager.item_type_files(),
+                "past_service_date_inventory": ["PastServiceDateInventory.txt"],
+                "damaged_inventory": ["DamagedInventory.txt"],
+            })
+            recorder.run(stage + "answer_batch", lambda: answer_batch(manager), calls=len(queries))
+            if store is None:
+                answer_queries(recorder, manager, queries)
+
+    clear_caches()
+    with working_directory(os.path.join(directory, "part2-jobs")):
+        manager = part2.InventoryManager()
+        manager.load_inventory()
+        recorder.run("part2.write_reports_in_parallel", lambda: manager.write_reports(jobs))
+        report_lines(recorder, "part2", {
+            "write_reports_in_parallel": list(part2.REPORT_FILES) + manager.item_type_files(),
+        })
+
+    clear_caches()
+    with working_directory(os.path.join(directory, "part2-snapshot")):
+        manager = part2.InventoryManager()
+        manager.load_inventory()
+        recorder.run("part2.save_snapshot", lambda: manager.save_snapshot(SNAPSHOT_FILE, source_stats()))
+        reopened = part2.InventoryManager()
+        if recorder.run("part2.open_snapshot", lambda: reopened.open_snapshot(SNAPSHOT_FILE)) is None:
+            raise RuntimeError("the snapshot written by part2.save_snapshot was not reopened")
+        recorder.results["part2.open_snapshot"]['rows'] = len(reopened.inventory)
+        recorder.run("part2.snapshot.answer_batch", lambda: answer_batch(reopened), calls=len(queries))
+
+
+def answer_batch(manager):
+    """Answers the query file as part2.py --batch does, keeping the answers off the benchmark output."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return part2.run_batch(manager, QUERY_FILE)
+
+
+def answer_queries(recorder, manager, queries):
+    """Times the part2 query methods on their own, then the interactive process_query."""
+    keys = [key for key in map(manager.query_key, queries) if key]
+    matches = recorder.run("part2.find_best_match", lambda: [manager.find_best_match(*key) for key in keys], calls=len(keys))
+    found = [(match, key[1]) for match, key in zip(matches, keys) if match]
+    recorder.results["part2.find_best_match"]['found'] = len(found)
+    alternatives = recorder.run("part2.find_closest_alternative",
+                                lambda: [manager.find_closest_alternative(item_id, item_type, item['Price'])
+                                         for (item_id, item), item_type in found], calls=len(found))
+    recorder.results["part2.find_closest_alternative"]['found'] = sum(1 for alternative in alternatives if alternative)
+
+    printed = io.StringIO()  # Keeps the printed answers off the benchmark output
+    def process_queries():
+        with contextlib.redirect_stdout(printed):
+            for query in queries:
+                manager.process_query(query)
+    recorder.run("part2.process_query", process_queries, calls=len(queries))
+    recorder.results["part2.process_query"]['lines'] = printed.getvalue().count("\n")
+
+
+def report_lines(recorder, prefix, files):
+    """Records the number of lines each report stage wrote."""
+    for stage, filenames in files.items():
+        recorder.results[f"{prefix.rstrip('.')}.{stage}"]['lines'] = count_lines(*filenames)
+
+
+def benchmark(count, seed=1, query_count=1000, repeat=DEFAULT_REPEAT, trace_memory=True, jobs=DEFAULT_JOBS):
+    """Generates an inventory of count items and returns the measurements of every stage."""
+    queries = make_queries(query_count, seed)
+    with tempfile.TemporaryDirectory(prefix="inventory-benchmark-") as directory:
+        data = os.path.join(directory, "data")
+        os.mkdir(data)
+        start = time.perf_counter()
+        generate_inventory(data, count, seed)
+        generated = time.perf_counter() - start
+        with open(os.path.join(data, QUERY_FILE), 'w') as file:
+            file.writelines(f"{query}\n" for query in queries)
+        for run_directory in [f"{part}-{storage}" for part in ("part1", "part2") for storage in STORAGES] + [
+                "part1-jobs", "part2-jobs", "part2-snapshot"]:
+            link_inputs(data, os.path.join(directory, run_directory))
+
+        passes = [False] * repeat + ([True] if trace_memory else [])
+        results = {}
+        for tracing in passes:
+            recorder = Recorder(tracing)
+            if tracing:
+                tracemalloc.start()
+            try:
+                for run in (run_part1, run_part2):
+                    run(recorder, directory, queries, jobs)
+            finally:
+                if tracing:
+                    tracemalloc.stop()
+            for stage, record in recorder.results.items():  # Collects the time of every timed pass
+                merged = results.setdefault(stage, {})
+                if 'seconds' in record:
+                    merged.setdefault('samples', []).append(record.pop('seconds'))
+                merged.update(record)
+    for record in results.values():
+        record['seconds'] = statistics.median(record['samples'])
+        record['spread'] = spread(record['samples'])
+    return {'items': count, 'generate_seconds': generated, 'stages': results}
+
+
+def spread(samples):
+    """Returns the relative spread of the timed passes of a stage: their range over their median."""
+    median = statistics.median(samples)
+    return (max(samples) - min(samples)) / median if median > 0 else 0.0
+
+
+def compare(run, baseline, tolerance):
+    """Returns the regressions of a run against its baseline, as messages."""
+    regressions = []
+    for stage, record in run['stages'].items():
+        old = baseline['stages'].get(stage)
+        if old is None:
+            continue
+        for key in ('rows', 'lines', 'calls', 'found'):
+            if key in old and key in record and old[key] != record[key]:
+                regressions.append(f"{stage}: {key} changed from {old[key]} to {record[key]}")
+        if 'seconds' in old and 'seconds' in record:
+            noise = max(NOISE_FLOOR, record.get('spread', 0.0), old.get('spread', 0.0))
+            if (record['seconds'] > old['seconds'] * (1 + tolerance + noise)
+                    and record['seconds'] - old['seconds'] > RESOLUTION_SECONDS):
+                regressions.append(f"{stage}: median {record['seconds']:.4f} s, baseline {old['seconds']:.4f} s "
+                                   f"(+{(record['seconds'] / old['seconds'] - 1) * 100:.0f}%, "
+                                   f"allowed +{(tolerance + noise) * 100:.0f}%)")
+        if 'peak_bytes' in old and 'peak_bytes' in record:
+            if record['peak_bytes'] > old['peak_bytes'] * (1 + tolerance) and record['peak_bytes'] - old['peak_bytes'] > NOISE_BYTES:
+                regressions.append(f"{stage}: peak {record['peak_bytes'] / 2**20:.1f} MiB, "
+                                   f"baseline {old['peak_bytes'] / 2**20:.1f} MiB")
+    return regressions
+
+
+def print_run(run, baseline=None):
+    """Prints the measurements of a run, with the change from the baseline when there is one."""
+    print(f"\n{run['items']} items (generated in {run['generate_seconds']:.2f} s)")
+    print(f"  {'stage':<46} {'median s':>10} {'spread':>7} {'baseline':>10} {'change':>8} {'peak MiB':>9}")
+    for stage, record in run['stages'].items():
+        old = (baseline or {}).get('stages', {}).get(stage, {})
+        seconds = record.get('seconds')
+        change = f"{(seconds / old['seconds'] - 1) * 100:+.0f}%" if seconds is not None and old.get('seconds') else ""
+        print(f"  {stage:<46} {seconds if seconds is not None else float('nan'):>10.4f} "
+              f"{record.get('spread', float('nan')) * 100:>6.0f}% "
+              f"{old.get('seconds', float('nan')):>10.4f} {change:>8} "
+              f"{record.get('peak_bytes', float('nan')) / 2**20:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the inventory pipelines on synthetic data.")
+    parser.add_argument("--items", nargs="+", default=["10k"], help="inventory sizes to run, such as 1k 100k 10M")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated inventory and queries")
+    parser.add_argument("--queries", type=int, default=1000, help="queries answered by each query stage")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed passes per size; the median time of each stage is kept")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="worker processes of the parallel report stages, at least 2")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass that measures peak memory")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with the results saved in FILE and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown or memory growth over the baseline, as a fraction, on top of the timing noise")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save the results to FILE as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'queries': args.queries,
+        'runs': {},
+    }
+    regressions = []
+    for count in map(parse_count, args.items):
+        run = benchmark(count, args.seed, args.queries, max(1, args.repeat), not args.no_memory, max(2, args.jobs))
+        results['runs'][str(count)] = run
+        old = baseline.get('runs', {}).get(str(count))
+        print_run(run, old)
+        if old is not None:
+            if (baseline.get('seed'), baseline.get('queries')) != (args.seed, args.queries):
+                regressions.append(f"{count} items: the baseline used a different seed or query count")
+            regressions += [f"{count} items, {message}" for message in compare(run, old, args.tolerance)]
+        elif args.baseline:
+            print(f"  (no baseline for {count} items)")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"\nSaved the results to {args.save_baseline}")
+
+    if regressions:
+        print(f"\nREGRESSIONS against {args.baseline}:", file=sys.stderr)
+        for message in regressions:
+            print(f"  {message}", file=sys.stderr)
+        sys.exit(1)
+    if args.baseline:
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Columnar storage engine for the inventory, a compact alternative to a dictionary of dictionaries.
+
+Each field is kept in its own column: dictionary-encoded manufacturer and item type codes,
+an integer array of prices, service dates as day ordinals and a damage map. Item IDs that are
+plain integers are stored as 64-bit integers, so ten million items take a few hundred megabytes.
+The store behaves like the usual ``{item_id: {'Manufacturer': ..., ...}}`` dictionary, so the
+report writers and the InventoryManager query methods work on it unchanged.
+"""
+
+import datetime
+import operator
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from itertools import accumulate, compress, repeat
+
+from service_dates import format_service_date
+
+MISSING_PRICE = -(1 << 63)  # Price column value for items without a price
+MISSING_DATE = 0  # Service date column value for items without a service date
+EMPTY_DATE = -1  # Service date column value for items whose service date was left empty (None)
+DAMAGED = 'damaged'  # Damage label stored by the damage map alone
+
+
+class ColumnarRecord(MutableMapping):
+    """Dictionary-like view of one row of a ColumnarInventory."""
+
+    __slots__ = ('store', 'row')
+
+    KEYS = ('Manufacturer', 'ItemType', 'Damaged', 'Price', 'ServiceDate')
+
+    def __init__(self, store, row):
+        self.store = store  # The inventory holding the row
+        self.row = row  # Position of the row in every column
+
+    def __getitem__(self, key):
+        return self.store.get_field(self.row, key)
+
+    def __setitem__(self, key, value):
+        self.store.set_field(self.row, key, value)
+
+    def __delitem__(self, key):
+        self.store.delete_field(self.row, key)
+
+    def __contains__(self, key):
+        return self.store.has_field(self.row, key)
+
+    def __iter__(self):
+        return (key for key in self.KEYS if self.store.has_field(self.row, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ColumnarInventory(MutableMapping):
+    """Inventory of item ID to item details, stored column by column."""
+
+    def __init__(self):
+        self.item_ids = array('q')  # Item ID of each row; becomes a list of strings for non-integer IDs
+        self.manufacturer_codes = array('I')  # Manufacturer code of each row
+        self.item_type_codes = array('I')  # Item type code of each row
+        self.prices = array('q')  # Price of each row, or MISSING_PRICE
+        self.service_dates = array('i')  # Service date ordinal of each row, MISSING_DATE or EMPTY_DATE
+        self.damaged = bytearray()  # 1 for damaged rows; one byte per row so scans run in C
+        self.live = bytearray()  # 0 for rows that have been deleted
+        self.damage_labels = {}  # Damage label of damaged rows whose label is not DAMAGED
+
+        self.manufacturers = []  # Manufacturer name of each code
+        self.manufacturer_lookup = {}  # Code of each manufacturer name
+        self.item_types = []  # Item type name of each code
+        self.item_type_lookup = {}  # Code of each item type name
+
+        # Item ID index: sorted IDs with their rows, plus recent additions not yet merged in
+        self.sorted_ids = array('q')
+        self.sorted_rows = array('q')
+        self.pending = {}
+        self.next_row = 0  # Row after the last one found, checked first as files tend to list items in the same order
+        self.size = 0  # Number of live rows
+
+    @classmethod
+    def from_inventory(cls, inventory):
+        """Returns a ColumnarInventory holding the items of any inventory mapping, in the same order."""
+        store = cls()
+        for item_id, item in inventory.items():
+            store[item_id] = item
+        return store
+
+    def is_compact(self):
+        """Checks whether every row is live and every stored name is still in use."""
+        return (self.size == len(self.live)
+                and len(set(self.manufacturer_codes)) == len(self.manufacturers)
+                and len(set(self.item_type_codes)) == len(self.item_types))
+
+    # Item IDs
+
+    def integer_ids(self):
+        """Checks whether item IDs are still stored as integers."""
+        return isinstance(self.item_ids, (array, memoryview))  # An array, or a memoryview over a snapshot
+
+    def id_key(self, item_id):
+        """Returns the stored form of an item ID, or None if it cannot be stored as an integer."""
+        if not self.integer_ids():  # Text IDs are stored as they are
+            return item_id
+        if (isinstance(item_id, str) and item_id.isascii() and item_id.isdigit() and len(item_id) < 19
+                and (item_id == '0' or item_id[0] != '0')):
+            return int(item_id)
+        return None
+
+    def id_at(self, row):
+        """Returns the item ID of a row as a string."""
+        return str(self.item_ids[row])
+
+    def switch_to_text_ids(self):
+        """Stores item IDs as strings from now on, for IDs that do not round-trip through int."""
+        self.item_ids = [str(item_id) for item_id in self.item_ids]
+        self.pending = {self.item_ids[row]: row for row in compress(range(len(self.live)), self.live)}
+        self.sorted_ids = []
+        self.sorted_rows = array('q')
+        self.merge_pending()
+
+    def merge_pending(self):
+        """Merges the recently added item IDs into the sorted index."""
+        merged_ids = array('q') if self.integer_ids() else []
+        merged_rows = array('q')
+        start = 0
+        for key, row in sorted(self.pending.items()):  # Copies the runs between new IDs in bulk
+            position = bisect_left(self.sorted_ids, key, start)
+            merged_ids += self.sorted_ids[start:position]
+            merged_rows += self.sorted_rows[start:position]
+            merged_ids.append(key)
+            merged_rows.append(row)
+            start = position
+        merged_ids += self.sorted_ids[start:]
+        merged_rows += self.sorted_rows[start:]
+        self.sorted_ids = merged_ids
+        self.sorted_rows = merged_rows
+        self.pending = {}
+
+    def find_row(self, item_id):
+        """Returns the row of an item ID, or None if it is not in the inventory."""
+        key = self.id_key(item_id)
+        return None if key is None else self.find_key(key)
+
+    def find_key(self, key):
+        """Returns the row of a stored item ID, or None if it is not in the inventory."""
+        row = self.next_row
+        if row < len(self.live) and self.item_ids[row] == key and self.live[row]:
+            self.next_row = row + 1
+            return row
+        row = self.pending.get(key)
+        if row is None:
+            position = bisect_left(self.sorted_ids, key)
+            if position == len(self.sorted_ids) or self.sorted_ids[position] != key:
+                return None
+            row = self.sorted_rows[position]
+        self.next_row = row + 1
+        return row
+
+    def append_row(self, item_id, key):
+        """Adds an empty row for a new item ID, given its id_key(), and returns it."""
+        if key is None:
+            self.switch_to_text_ids()
+            key = item_id
+        row = len(self.live)
+        self.item_ids.append(key)
+        self.manufacturer_codes.append(0)
+        self.item_type_codes.append(0)
+        self.prices.append(MISSING_PRICE)
+        self.service_dates.append(MISSING_DATE)
+        self.damaged.append(0)
+        self.live.append(1)
+        self.pending[key] = row
+        if len(self.pending) > max(4096, len(self.sorted_ids) >> 3):  # Keeps merging cost linear overall
+            self.merge_pending()
+        self.size += 1
+        return row
+
+    # Fields
+
+    def encode(self, names, lookup, name):
+        """Returns the code of a name, adding it to the dictionary if it is new."""
+        code = lookup.get(name)
+        if code is None:
+            code = lookup[name] = len(names)
+            names.append(sys.intern(name))
+        return code
+
+    def has_field(self, row, key):
+        """Checks whether a row has a value for a field."""
+        if key == 'Price':
+            return self.prices[row] != MISSING_PRICE
+        if key == 'ServiceDate':
+            return self.service_dates[row] != MISSING_DATE
+        return key in ('Manufacturer', 'ItemType', 'Damaged')
+
+    def get_field(self, row, key):
+        """Returns the decoded value of a field of a row."""
+        if key == 'Manufacturer':
+            return self.manufacturers[self.manufacturer_codes[row]]
+        if key == 'ItemType':
+            return self.item_types[self.item_type_codes[row]]
+        if key == 'Damaged':
+            return self.damage_label(row)
+        if key == 'Price' and self.prices[row] != MISSING_PRICE:
+            return self.prices[row]
+        if key == 'ServiceDate' and self.service_dates[row] != MISSING_DATE:
+            ordinal = self.service_dates[row]
+            return None if ordinal == EMPTY_DATE else datetime.datetime.fromordinal(ordinal)
+        raise KeyError(key)
+
+    def set_field(self, row, key, value):
+        """Encodes a value into the column of a field."""
+        if key == 'Manufacturer':
+            self.manufacturer_codes[row] = self.encode(self.manufacturers, self.manufacturer_lookup, value)
+        elif key == 'ItemType':
+            self.item_type_codes[row] = self.encode(self.item_types, self.item_type_lookup, value)
+        elif key == 'Damaged':
+            self.damaged[row] = 1 if value else 0
+            self.damage_labels.pop(row, None)
+            if value and value != DAMAGED:
+                self.damage_labels[row] = value
+        elif key == 'Price':
+            self.prices[row] = value
+        elif key == 'ServiceDate':
+            self.service_dates[row] = EMPTY_DATE if value is None else value.toordinal()
+        else:
+            raise KeyError(key)
+
+    def delete_field(self, row, key):
+        """Removes the value of the price or service date of a row."""
+        if not self.has_field(row, key) or key not in ('Price', 'ServiceDate'):
+            raise KeyError(key)
+        if key == 'Price':
+            self.prices[row] = MISSING_PRICE
+        else:
+            self.service_dates[row] = MISSING_DATE
+
+    # Mapping interface
+
+    def __getitem__(self, item_id):
+        row = self.find_row(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        return ColumnarRecord(self, row)
+
+    def get(self, item_id, default=None):
+        row = self.find_row(item_id)
+        return default if row is None else ColumnarRecord(self, row)
+
+    def __setitem__(self, item_id, item):
+        key = self.id_key(item_id)
+        row = None if key is None else self.find_key(key)
+        if row is None:
+            row = self.append_row(item_id, key)
+        else:  # Replacing an item clears the fields the new details leave out, as a dictionary would
+            self.prices[row] = MISSING_PRICE
+            self.service_dates[row] = MISSING_DATE
+        self.manufacturer_codes[row] = self.encode(self.manufacturers, self.manufacturer_lookup, item.get('Manufacturer', ""))
+        self.item_type_codes[row] = self.encode(self.item_types, self.item_type_lookup, item.get('ItemType', ""))
+        damaged = item.get('Damaged', "")
+        if damaged or self.damaged[row]:
+            self.set_field(row, 'Damaged', damaged)
+        for key in ('Price', 'ServiceDate'):
+            if key in item:
+                self.set_field(row, key, item[key])
+
+    def __delitem__(self, item_id):
+        row = self.find_row(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        key = self.id_key(item_id)
+        if key in self.pending:
+            del self.pending[key]
+        else:
+            position = bisect_left(self.sorted_ids, key)
+            del self.sorted_ids[position]
+            del self.sorted_rows[position]
+        self.live[row] = 0
+        self.damage_labels.pop(row, None)
+        self.size -= 1
+
+    def __contains__(self, item_id):
+        return self.find_row(item_id) is not None
+
+    def __iter__(self):
+        return (self.id_at(row) for row in self.rows())
+
+    def __len__(self):
+        return self.size
+
+    def rows(self):
+        """Returns an iterator over the live rows in the order they were added."""
+        return compress(range(len(self.live)), self.live)
+
+    def items(self):
+        """Returns an iterator over (item ID, record) pairs in the order they were added."""
+        return ((self.id_at(row), ColumnarRecord(self, row)) for row in self.rows())
+
+    def values(self):
+        """Returns an iterator over the records in the order they were added."""
+        return (ColumnarRecord(self, row) for row in self.rows())
+
+    # Scans
+
+    def select(self, manufacturer=None, item_type=None, damaged=None, min_price=None, max_price=None,
+               serviced_after=None, serviced_before=None):
+        """Returns the item IDs of rows matching every given condition, in the order they were added."""
+        rows = self.select_rows(manufacturer, item_type, damaged, min_price, max_price, serviced_after, serviced_before)
+        return [self.id_at(row) for row in rows]
+
+    def select_rows(self, manufacturer=None, item_type=None, damaged=None, min_price=None, max_price=None,
+                    serviced_after=None, serviced_before=None):
+        """Returns the live rows matching every given condition, in the order they were added.
+
+        Each condition is evaluated over a whole column with map() and compress(), so the
+        scan runs in C rather than row by row in Python. Service dates compare the same way
+        as the datetime values they stand for: ``serviced_after`` keeps ``ServiceDate > value``.
+        """
+        mask = iter(self.live)
+        if manufacturer is not None:
+            code = self.manufacturer_lookup.get(manufacturer)
+            if code is None:
+                return []
+            mask = map(operator.and_, mask, map(code.__eq__, self.manufacturer_codes))
+        if item_type is not None:
+            code = self.item_type_lookup.get(item_type)
+            if code is None:
+                return []
+            mask = map(operator.and_, mask, map(code.__eq__, self.item_type_codes))
+        if damaged is not None:
+            mask = map(operator.and_, mask, self.damaged if damaged else map(operator.not_, self.damaged))
+        if min_price is not None or max_price is not None:
+            mask = map(operator.and_, mask, map(MISSING_PRICE.__ne__, self.prices))
+        if min_price is not None:
+            mask = map(operator.and_, mask, map(operator.le, repeat(min_price), self.prices))
+        if max_price is not None:
+            mask = map(operator.and_, mask, map(operator.ge, repeat(max_price), self.prices))
+        if serviced_after is not None:  # A midnight service date is after a moment only on a later day
+            mask = map(operator.and_, mask, map(operator.lt, repeat(serviced_after.toordinal()), self.service_dates))
+        if serviced_before is not None:  # ...and before it on an earlier day, or the same day after midnight
+            limit = serviced_before.toordinal()
+            if isinstance(serviced_before, datetime.datetime) and serviced_before.time() != datetime.time():
+                limit += 1
+            mask = map(operator.and_, mask, map(operator.lt, repeat(0), self.service_dates))
+            mask = map(operator.and_, mask, map(operator.gt, repeat(limit), self.service_dates))
+        return list(compress(range(len(self.live)), mask))
+
+    def first_ordinal_from(self, moment):
+        """Returns the smallest service date ordinal that is not before a moment."""
+        limit = moment.toordinal()  # A midnight service date is not before a moment from that day's midnight on
+        if isinstance(moment, datetime.datetime) and moment.time() != datetime.time():
+            limit += 1
+        return limit
+
+    def next_service_date(self, moment):
+        """Returns the earliest service date of a live row that is not before moment, or None if there is none."""
+        ordinal = min(filter(self.first_ordinal_from(moment).__le__, compress(self.service_dates, self.live)), default=None)
+        return None if ordinal is None else datetime.datetime.fromordinal(ordinal)
+
+    def service_dates_from(self, moment):
+        """Returns (service date, row, item ID) for the live rows whose service date is not before moment.
+
+        The rows come in the order they were added, and each distinct date is decoded once.
+        """
+        limit = self.first_ordinal_from(moment)
+        mask = map(operator.and_, self.live, map(operator.le, repeat(limit), self.service_dates))
+        rows = list(compress(range(len(self.live)), mask))
+        ordinals = list(map(self.service_dates.__getitem__, rows))
+        dates = {ordinal: datetime.datetime.fromordinal(ordinal) for ordinal in set(ordinals)}
+        item_ids = map(self.item_ids.__getitem__, rows)
+        if self.integer_ids():
+            item_ids = map(str, item_ids)
+        return list(zip(map(dates.__getitem__, ordinals), rows, item_ids))
+
+    def names_in_use(self):
+        """Returns the manufacturer and item type names of the live rows, each once, in order of last use."""
+        manufacturers = dict.fromkeys(compress(reversed(self.manufacturer_codes), reversed(self.live)))
+        item_types = dict.fromkeys(compress(reversed(self.item_type_codes), reversed(self.live)))
+        return ([self.manufacturers[code] for code in reversed(manufacturers)],
+                [self.item_types[code] for code in reversed(item_types)])
+
+    def query_candidates(self, moment):
+        """Returns an iterator of (price, position, item ID, service date, manufacturer, item type) for the
+        live rows that are not damaged and have a price and a service date after moment.
+
+        The position counts the live rows before the row, and the names are in lower case.
+        """
+        limit = moment.toordinal()  # A midnight service date is after a moment only on a later day
+        mask = map(operator.and_, self.live, map(operator.not_, self.damaged))
+        mask = map(operator.and_, mask, map(MISSING_PRICE.__ne__, self.prices))
+        mask = map(operator.and_, mask, map(operator.lt, repeat(limit), self.service_dates))
+        rows = list(compress(range(len(self.live)), mask))
+        if self.size == len(self.live):  # No deleted rows, so each row is its position
+            positions = rows
+        else:
+            live_counts = list(accumulate(self.live))
+            positions = map(operator.sub, map(live_counts.__getitem__, rows), repeat(1))
+        ordinals = list(map(self.service_dates.__getitem__, rows))
+        dates = {ordinal: datetime.datetime.fromordinal(ordinal) for ordinal in set(ordinals)}
+        manufacturers = [name.lower() for name in self.manufacturers]
+        item_types = [name.lower() for name in self.item_types]
+        return zip(map(self.prices.__getitem__, rows), positions, self.ids_at(rows), map(dates.__getitem__, ordinals),
+                   map(manufacturers.__getitem__, map(self.manufacturer_codes.__getitem__, rows)),
+                   map(item_types.__getitem__, map(self.item_type_codes.__getitem__, rows)))
+
+    # Report orderings
+
+    def rows_by_manufacturer(self):
+        """Returns the live rows sorted alphabetically by manufacturer, ties in the order they were added.
+
+        The manufacturers are ranked once, so the sort compares small integers looked up by row.
+        """
+        ranks = [0] * len(self.manufacturers)
+        for rank, code in enumerate(sorted(range(len(self.manufacturers)), key=self.manufacturers.__getitem__)):
+            ranks[code] = rank
+        keys = list(map(ranks.__getitem__, self.manufacturer_codes))  # Rank of each row
+        return sorted(self.rows(), key=keys.__getitem__)
+
+    def rows_by_item_id(self, rows):
+        """Returns the rows sorted by item ID as text, as a dictionary inventory's keys would sort."""
+        keys = list(self.ids_at(rows))
+        return list(map(rows.__getitem__, sorted(range(len(rows)), key=keys.__getitem__)))
+
+    def ids_at(self, rows):
+        """Returns an iterator of the item IDs of the rows as strings."""
+        if self.integer_ids():  # Converted in C rather than by a call per row
+            return map(str, map(self.item_ids.__getitem__, rows))
+        return map(self.id_at, rows)
+
+    def rows_by_service_date(self, rows):
+        """Returns the dated rows sorted by service date, ties in the order given."""
+        return sorted(rows, key=self.service_dates.__getitem__)
+
+    def rows_by_price(self, rows):
+        """Returns the rows sorted by price from highest to lowest, counting a missing price as 0, ties in the order given."""
+        prices = self.prices
+        return sorted(rows, key=lambda row: 0 if prices[row] == MISSING_PRICE else prices[row], reverse=True)
+
+    def report_fields(self, rows):
+        """Returns an iterator of (item ID, manufacturer, item type, price, service date, damage label)
+        for the rows, with the price and service date as report text ('N/A' when missing).
+
+        The fields are read from the columns without building a record per row, and each
+        distinct price and date is converted to text once.
+        """
+        item_ids = self.ids_at(rows)
+        manufacturers = map(self.manufacturers.__getitem__, map(self.manufacturer_codes.__getitem__, rows))
+        item_types = map(self.item_types.__getitem__, map(self.item_type_codes.__getitem__, rows))
+        prices = map(PriceTexts().__getitem__, map(self.prices.__getitem__, rows))
+        service_dates = map(DateTexts().__getitem__, map(self.service_dates.__getitem__, rows))
+        if self.damage_labels:
+            damaged = map(self.damage_label, rows)
+        else:  # Every damaged row has the default label
+            damaged = map(("", DAMAGED).__getitem__, map(self.damaged.__getitem__, rows))
+        return zip(item_ids, manufacturers, item_types, prices, service_dates, damaged)
+
+    def damage_label(self, row):
+        """Returns the damage label of a row, or "" if it is not damaged."""
+        return self.damage_labels.get(row, DAMAGED) if self.damaged[row] else ""
+
+
+class PriceTexts(dict):
+    """Maps a price column value to its report text, converting each distinct price once."""
+
+    def __missing__(self, price):
+        text = self[price] = 'N/A' if price == MISSING_PRICE else str(price)
+        return text
+
+
+class DateTexts(dict):
+    """Maps a service date column value to its report text, converting each distinct date once."""
+
+    def __missing__(self, ordinal):
+        if ordinal == MISSING_DATE:
+            text = 'N/A'
+        else:  # An empty service date fails to format, as it does in a dictionary inventory
+            text = format_service_date(None if ordinal == EMPTY_DATE else datetime.datetime.fromordinal(ordinal))
+        self[ordinal] = text
+        return text
@@ -0,0 +1,62 @@
+"""Releases inventory items in service date order as time passes their service dates.
+
+InventoryManager keeps two schedulers: one over the items in the query indexes, which drops
+them from the indexes once their service date is no longer in the future, and one over the
+dated items not yet in PastServiceDateInventory.txt, which adds them to the report once
+their service date is in the past. Each check costs O(1) until something is due, and each
+item is released once, so a long-running session never rescans the inventory.
+"""
+
+import datetime
+import heapq
+
+
+class ExpiryScheduler:
+    """Min-heap of (service date, position, item ID) entries, released once a clock reaches their dates.
+
+    Entries may also be given as a sequence already sorted by service date, such as a query
+    index, which is consumed from start onwards without being copied. inclusive says whether an
+    entry is due when the clock equals its service date, or only after it. clock is
+    injectable for testing.
+    """
+
+    def __init__(self, entries=(), ordered=(), inclusive=True, clock=datetime.datetime.now, start=0):
+        self.heap = list(entries)  # Entries in heap order
+        heapq.heapify(self.heap)
+        self.ordered = ordered  # Entries sorted by service date, due from the front
+        self.start = start  # Number of ordered entries already released
+        self.inclusive = inclusive
+        self.clock = clock  # Returns the current date and time
+
+    def __len__(self):
+        return len(self.heap) + len(self.ordered) - self.start
+
+    def next_due(self):
+        """Returns the earliest service date still scheduled, or None if nothing is."""
+        dates = []
+        if self.heap:
+            dates.append(self.heap[0][0])
+        if self.start < len(self.ordered):
+            dates.append(self.ordered[self.start][0])
+        return min(dates, default=None)
+
+    def is_due(self, service_date, now):
+        """Checks whether an entry with this service date is due at the time now."""
+        return service_date <= now if self.inclusive else service_date < now
+
+    def pop_due(self, now=None):
+        """Removes and returns the entries that are due, in service date order."""
+        now = self.clock() if now is None else now
+        due = []
+        while True:
+            next_ordered = self.ordered[self.start] if self.start < len(self.ordered) else None
+            if self.heap and (next_ordered is None or self.heap[0] < next_ordered):
+                if not self.is_due(self.heap[0][0], now):
+                    break
+                due.append(heapq.heappop(self.heap))
+            elif next_ordered is not None and self.is_due(next_ordered[0], now):
+                due.append(next_ordered)
+                self.start += 1
+            else:
+                break
+        return due
@@ -0,0 +1,285 @@
+"""Incremental rebuilds of the inventory from changes to the three input files.
+
+A snapshot saved after each run holds the processed inventory and, for every input file, its
+size, modification time, checksum, line count and the rows keyed by item ID. On the next run:
+
+- a file whose size and modification time are unchanged is not read at all;
+- a file that only grew is read from the byte offset where the last run stopped;
+- any other file is read again and compared with the previous rows, item by item.
+
+Only the changed items are applied to the inventory, and ReportChanges tells the caller which
+report files those items touch.
+"""
+
+import datetime
+import hashlib
+import os
+import pickle
+
+from service_dates import parse_service_date
+
+SNAPSHOT_VERSION = 1  # Bumped whenever the snapshot layout changes
+
+# Input files in processing order: (kind, file name, number of fields required)
+SOURCES = (
+    ('manufacturers', "ManufacturerList.txt", 3),
+    ('prices', "PriceList.txt", 2),
+    ('service_dates', "ServiceDatesList.txt", 2),
+)
+
+READ_SIZE = 1 << 16  # Bytes hashed at a time when checking the unchanged start of a file
+MISSING = object()  # Stands for a row that is not in a file
+
+
+class ReportChanges:
+    """Which report files need to be written again."""
+
+    def __init__(self, full_inventory=False, item_types=(), past_service_date=False, damaged=False):
+        self.full_inventory = full_inventory  # FullInventory.txt
+        self.item_types = item_types  # Item types whose files changed, or None for every type
+        self.past_service_date = past_service_date  # PastServiceDateInventory.txt
+        self.damaged = damaged  # DamagedInventory.txt
+
+    @classmethod
+    def everything(cls):
+        """Returns the changes of a full rebuild."""
+        return cls(True, None, True, True)
+
+
+def parse_value(kind, fields):
+    """Converts the fields of an input line into the value stored for its item ID."""
+    if kind == 'manufacturers':
+        return (fields[1].strip(), fields[2].strip(), fields[3].strip() if len(fields) > 3 else "")
+    if kind == 'prices':
+        return int(fields[1].strip())
+    date_text = fields[1].strip()
+    return parse_service_date(date_text) if date_text else None
+
+
+def parse_line(filename, kind, field_count, line_number, raw_line):
+    """Returns (item ID, value) for an input line, None for a blank line, or raises ValueError."""
+    line = raw_line.decode().strip()
+    if not line:
+        return None
+    fields = line.split(',')
+    if len(fields) < field_count or not fields[0].strip():
+        raise ValueError(f"{filename}, line {line_number}: expected {field_count} comma-separated fields, got {line!r}")
+    try:
+        return fields[0].strip(), parse_value(kind, fields)
+    except ValueError:
+        raise ValueError(f"{filename}, line {line_number}: invalid value {fields[1].strip()!r} in field 2") from None
+
+
+def build_record(item_id, rows):
+    """Returns the inventory details of an item from the rows of the three input files."""
+    manufacturer, item_type, damaged = rows['manufacturers'][item_id]
+    record = {'Manufacturer': manufacturer, 'ItemType': item_type, 'Damaged': damaged}
+    if item_id in rows['prices']:
+        record['Price'] = rows['prices'][item_id]
+    if item_id in rows['service_dates']:
+        record['ServiceDate'] = rows['service_dates'][item_id]
+    return record
+
+
+class IncrementalBuild:
+    """Loads the inventory by applying input file changes to the snapshot of the last run."""
+
+    def __init__(self, snapshot_path, directory=".", new_inventory=dict):
+        self.snapshot_path = snapshot_path  # Where the snapshot is kept between runs
+        self.directory = directory  # Directory holding the input files and reports
+        self.new_inventory = new_inventory  # Creates an empty inventory store for a full rebuild
+        self.snapshot = None  # Filled by load()
+
+    def path(self, filename):
+        """Returns the path of an input or report file."""
+        return os.path.join(self.directory, filename)
+
+    def read_snapshot(self):
+        """Returns the snapshot of the last run, or None if there is no usable one."""
+        try:
+            with open(self.snapshot_path, 'rb') as file:
+                snapshot = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def scan(self, kind, filename, field_count, state, rows):
+        """Brings the rows of one input file up to date.
+
+        Returns (state, changed item IDs in file order, whether the whole file was read).
+        Only a file read whole can have had rows removed or moved.
+        """
+        path = self.path(filename)
+        status = os.stat(path)
+        if state and status.st_size == state['size'] and status.st_mtime_ns == state['mtime_ns']:
+            return state, {}, False  # Untouched since the last run
+
+        with open(path, 'rb') as file:
+            hasher = hashlib.sha256()
+            line_number = 0
+            changed = {}  # Used as an ordered set, so that new items are added in file order
+            if state and state['ends_with_newline'] and status.st_size >= state['size']:
+                remaining = state['size']  # Checks whether the file only grew
+                while remaining:
+                    chunk = file.read(min(READ_SIZE, remaining))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+                if not remaining and hasher.hexdigest() == state['sha256']:
+                    line_number = state['lines']  # Reads on from where the last run stopped
+                else:
+                    file.seek(0)
+                    hasher = hashlib.sha256()
+                    state = None
+            else:
+                state = None
+
+            if state is None:  # Reads the whole file and compares it item by item
+                previous, new_rows = rows, {}
+            else:
+                previous, new_rows = None, rows
+            last_line = b""
+            for raw_line in file:
+                line_number += 1
+                hasher.update(raw_line)
+                last_line = raw_line
+                parsed = parse_line(filename, kind, field_count, line_number, raw_line)
+                if parsed is None:
+                    continue
+                item_id, value = parsed
+                if previous is None and (item_id not in new_rows or new_rows[item_id] != value):
+                    changed[item_id] = None  # Appended lines only change the items they name
+                new_rows[item_id] = value  # Later lines win, as they do when processing the lists
+
+        if previous is not None:
+            changed = {item_id: None for item_id, value in new_rows.items() if previous.get(item_id, MISSING) != value}
+            changed.update(dict.fromkeys(previous.keys() - new_rows.keys()))
+            rows.clear()
+            rows.update(new_rows)
+
+        ends_with_newline = last_line.endswith(b"\n") if last_line else bool(state and state['ends_with_newline'])
+        new_state = {
+            'size': status.st_size,
+            'mtime_ns': status.st_mtime_ns,
+            'sha256': hasher.hexdigest(),
+            'lines': line_number,
+            'ends_with_newline': ends_with_newline or status.st_size == 0,
+        }
+        return new_state, changed, previous is not None
+
+    def load(self, today=None):
+        """Returns the up-to-date inventory and the ReportChanges since the last run."""
+        today = today or datetime.datetime.now()
+        snapshot = self.read_snapshot()
+        if snapshot is not None and type(snapshot['inventory']) is not type(self.new_inventory()):
+            snapshot = None  # The inventory is kept in a different kind of store this time
+        full = snapshot is None
+        if full:
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'states': {kind: None for kind, filename, field_count in SOURCES},
+                'rows': {kind: {} for kind, filename, field_count in SOURCES},
+                'inventory': self.new_inventory(),
+                'type_counts': {},
+                'report_date': None,
+                'report_stats': {},
+            }
+
+        rows = snapshot['rows']
+        changed = {}  # Changed item IDs, those of ManufacturerList.txt first and in file order
+        rewritten = set()  # Input files that were read whole this time
+        for kind, filename, field_count in SOURCES:
+            state, kind_changed, whole = self.scan(kind, filename, field_count, snapshot['states'][kind], rows[kind])
+            if whole:
+                rewritten.add(kind)
+            snapshot['states'][kind] = state
+            changed.update(kind_changed)
+
+        inventory = snapshot['inventory']
+        type_counts = snapshot['type_counts']
+        changes = ReportChanges(item_types=set())
+        # Applies each changed item and notes the reports it appears in; new items arrive in
+        # file order, so appended rows keep the inventory in ManufacturerList.txt order
+        for item_id in changed:
+            before = dict(inventory[item_id]) if item_id in inventory else None  # A copy, since the store may reuse it
+            after = build_record(item_id, rows) if item_id in rows['manufacturers'] else None
+            if after is None:
+                if before is None:
+                    continue  # A price or date for an item that is not in the inventory
+                del inventory[item_id]
+            else:
+                inventory[item_id] = after
+            for record, count in ((before, -1), (after, 1)):
+                if record is None:
+                    continue
+                changes.full_inventory = True
+                changes.item_types.add(record['ItemType'])
+                type_counts[record['ItemType']] = type_counts.get(record['ItemType'], 0) + count
+                changes.damaged = changes.damaged or bool(record['Damaged'])
+                service_date = record.get('ServiceDate')
+                changes.past_service_date = changes.past_service_date or (service_date is not None and service_date < today)
+
+        if 'manufacturers' in rewritten and list(inventory) != list(rows['manufacturers']):
+            # Items were reordered in ManufacturerList.txt; rebuild so ties keep the file order
+            inventory = self.new_inventory()
+            for item_id in rows['manufacturers']:
+                inventory[item_id] = build_record(item_id, rows)
+            snapshot['inventory'] = inventory
+            full = True
+
+        if full:
+            changes = ReportChanges.everything()
+            type_counts.clear()
+            for item in inventory.values():
+                type_counts[item['ItemType']] = type_counts.get(item['ItemType'], 0) + 1
+
+        if snapshot['report_date'] != today.date():  # Service dates may have passed since the last run
+            changes.past_service_date = True
+        self.add_stale_reports(changes, snapshot['report_stats'], type_counts)
+        if changes.item_types is not None:  # Types left without items get no file, as in a full run
+            changes.item_types = {item_type for item_type in changes.item_types if type_counts.get(item_type)}
+        for item_type in [item_type for item_type, count in type_counts.items() if not count]:
+            del type_counts[item_type]
+
+        snapshot['report_date'] = today.date()
+        self.snapshot = snapshot
+        return inventory, changes
+
+    def report_files(self, type_counts):
+        """Returns (file name, item type) for every report file, with None for the shared reports."""
+        files = [("FullInventory.txt", None), ("PastServiceDateInventory.txt", None), ("DamagedInventory.txt", None)]
+        files += [(f"{item_type.capitalize()}Inventory.txt", item_type) for item_type, count in type_counts.items() if count]
+        return files
+
+    def report_stat(self, filename):
+        """Returns the size and modification time of a report file, or None if it is missing."""
+        try:
+            status = os.stat(self.path(filename))
+        except FileNotFoundError:
+            return None
+        return status.st_size, status.st_mtime_ns
+
+    def add_stale_reports(self, changes, report_stats, type_counts):
+        """Marks report files that are missing or were written by another run as changed."""
+        attributes = {"FullInventory.txt": 'full_inventory', "PastServiceDateInventory.txt": 'past_service_date',
+                      "DamagedInventory.txt": 'damaged'}
+        for filename, item_type in self.report_files(type_counts):
+            stat = self.report_stat(filename)
+            if stat is not None and report_stats.get(filename) == stat:
+                continue
+            if item_type is None:
+                setattr(changes, attributes[filename], True)
+            elif changes.item_types is not None:
+                changes.item_types.add(item_type)
+
+    def save(self):
+        """Saves the snapshot for the next run, once the changed reports have been written."""
+        type_counts = self.snapshot['type_counts']
+        self.snapshot['report_stats'] = {filename: self.report_stat(filename) for filename, item_type in self.report_files(type_counts)}
+        temporary = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            pickle.dump(self.snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.snapshot_path)  # Replaces the old snapshot in a single rename
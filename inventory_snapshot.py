@@ -0,0 +1,265 @@
+"""Memory-mapped binary snapshots of a processed inventory and its query indexes.
+
+A snapshot file holds a short JSON header followed by the raw columns of a ColumnarInventory
+and the rows of each query index, every block aligned to 8 bytes:
+
+    MAGIC | header length (8 bytes, little-endian) | JSON header | padding | blocks...
+
+Opening a snapshot maps the file and wraps each block in a memoryview, so nothing is parsed
+or copied up front and the operating system pages data in as queries touch it. Item IDs that
+are not integers are kept as one block of UTF-8 text and a block of offsets into it, and each
+ID is decoded only when it is read. The header records the size and modification time of the input files; a snapshot whose input files have
+changed since it was written is ignored.
+"""
+
+import datetime
+import itertools
+import json
+import mmap
+import operator
+import os
+import sys
+from array import array
+
+from columnar_inventory import ColumnarInventory
+
+MAGIC = b"INVSNAP3"  # Identifies a snapshot file and its layout version
+ALIGNMENT = 8  # Every block starts at a multiple of this many bytes
+
+# Input files a snapshot is built from
+SOURCES = ("ManufacturerList.txt", "PriceList.txt", "ServiceDatesList.txt")
+
+# Array columns of a ColumnarInventory and their type codes
+COLUMNS = (
+    ('item_ids', 'q'),
+    ('manufacturer_codes', 'I'),
+    ('item_type_codes', 'I'),
+    ('prices', 'q'),
+    ('service_dates', 'i'),
+    ('damaged', 'B'),
+    ('live', 'B'),
+    ('sorted_ids', 'q'),
+    ('sorted_rows', 'q'),
+)
+
+# Blocks holding text item IDs in place of the item_ids and sorted_ids columns
+TEXT_ID_BLOCKS = (
+    ('item_id_offsets', 'q'),
+    ('item_id_text', 'B'),
+)
+
+
+def source_stats(directory="."):
+    """Returns the size and modification time of each input file, or None for a missing file."""
+    stats = {}
+    for filename in SOURCES:
+        try:
+            status = os.stat(os.path.join(directory, filename))
+        except FileNotFoundError:
+            stats[filename] = None
+        else:
+            stats[filename] = [status.st_size, status.st_mtime_ns]
+    return stats
+
+
+def layout():
+    """Returns the byte order and item sizes the raw blocks depend on."""
+    return {'byteorder': sys.byteorder, 'itemsizes': {code: array(code).itemsize for name, code in COLUMNS}}
+
+
+class IndexGroup:
+    """Read-only sequence of (value, position, item ID) query index entries backed by rows of a store.
+
+    The value is the field the index is sorted on, 'Price' or 'ServiceDate'. The position of
+    an entry is its row, which keeps ties in inventory order as the entries of
+    InventoryManager.build_query_index do.
+    """
+
+    __slots__ = ('store', 'rows', 'field')
+
+    def __init__(self, store, rows, field='Price'):
+        self.store = store  # The inventory holding the rows
+        self.rows = rows  # Rows of the group, sorted by (value, row)
+        self.field = field  # Field the entries are sorted on
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        row = self.rows[index]
+        return (self.store.get_field(row, self.field), row, self.store.id_at(row))
+
+    def without(self, rows):
+        """Returns a new group of the entries whose rows are not among the given rows."""
+        kept = map(operator.not_, map(rows.__contains__, self.rows))
+        return IndexGroup(self.store, array('q', itertools.compress(self.rows, kept)), self.field)
+
+
+class TextIds:
+    """Read-only sequence of text item IDs, each decoded from a block of UTF-8 text when it is read.
+
+    The ID of row r is the text between offsets[r] and offsets[r + 1]. Given rows, the
+    sequence holds the IDs of those rows in that order, as the sorted item ID index does.
+    """
+
+    __slots__ = ('offsets', 'text', 'rows')
+
+    def __init__(self, offsets, text, rows=None):
+        self.offsets = offsets  # Start of the ID of each row in the text, followed by the end of the text
+        self.text = text  # UTF-8 encoded IDs of every row, back to back
+        self.rows = rows  # Rows of the IDs in the sequence, or None for every row in order
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.rows is None else len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("item ID index out of range")
+        row = index if self.rows is None else self.rows[index]
+        return str(self.text[self.offsets[row]:self.offsets[row + 1]], 'utf-8')
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    @staticmethod
+    def encode(item_ids):
+        """Returns the (offsets, text) blocks holding a sequence of text item IDs."""
+        encoded = [item_id.encode() for item_id in item_ids]
+        offsets = array('q', [0])
+        offsets.extend(itertools.accumulate(map(len, encoded)))
+        return offsets, b"".join(encoded)
+
+
+class InventorySnapshot:
+    """An inventory and query indexes read from a snapshot file."""
+
+    def __init__(self, inventory, indexes, index_valid_until, report_date):
+        self.inventory = inventory  # Read-only ColumnarInventory over the mapped file
+        self.indexes = indexes  # Maps index name to an IndexGroup, or to a dictionary of them by group key
+        self.index_valid_until = index_valid_until  # Earliest service date in the indexes
+        self.report_date = report_date  # Day the reports were written alongside the snapshot
+
+
+def compact_store(inventory):
+    """Returns the inventory as a ColumnarInventory whose rows are its positions, copying it if needed."""
+    if isinstance(inventory, ColumnarInventory) and inventory.is_compact():
+        return inventory
+    return ColumnarInventory.from_inventory(inventory)
+
+
+def save_snapshot(path, inventory, indexes, index_valid_until, sources, report_date=None):
+    """Writes a snapshot of an inventory and its query indexes.
+
+    indexes maps each index name to (field, index), where the index is a sorted list of
+    (value, position, item ID) entries or a dictionary of such lists. The entries must be
+    positioned by inventory order, as build_query_index leaves them. sources should be the source_stats() taken before the input files were read,
+    so that a file changed during loading invalidates the snapshot.
+    """
+    store = compact_store(inventory)
+    if store.pending:
+        store.merge_pending()  # The sorted ID index must hold every item
+    blocks = []  # (name, column) for every block after the header
+    header = dict(layout(), sources=sources, size=store.size,
+                  manufacturers=store.manufacturers, item_types=store.item_types,
+                  damage_labels=sorted(store.damage_labels.items()),
+                  index_valid_until=index_valid_until.isoformat() if index_valid_until else None,
+                  report_date=(report_date or datetime.date.today()).isoformat())
+    if store.integer_ids():
+        blocks += [(name, getattr(store, name)) for name, code in COLUMNS]
+    else:  # Text item IDs are encoded once; the sorted index reads them through the sorted rows
+        blocks += [(name, getattr(store, name)) for name, code in COLUMNS if name not in ('item_ids', 'sorted_ids')]
+        blocks += zip((name for name, code in TEXT_ID_BLOCKS), TextIds.encode(store.item_ids))
+
+    header['indexes'] = {}
+    for name, (field, index) in indexes.items():
+        rows = array('q')
+        groups = None  # [*group key, first, end] for each group of a dictionary, in the order of the rows block
+        if isinstance(index, dict):
+            groups = []
+            for group, entries in index.items():
+                first = len(rows)
+                rows.extend(position for value, position, item_id in entries)
+                groups.append([*(group if isinstance(group, tuple) else (group,)), first, len(rows)])
+        else:
+            rows.extend(position for value, position, item_id in index)
+        header['indexes'][name] = {'field': field, 'groups': groups}
+        blocks.append((name, rows))
+
+    offset = 0
+    header['blocks'] = {}
+    for name, block in blocks:  # Offsets are relative to the end of the padded header
+        header['blocks'][name] = [offset, memoryview(block).nbytes]
+        offset += -(-header['blocks'][name][1] // ALIGNMENT) * ALIGNMENT
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    encoded += b" " * (-(len(MAGIC) + 8 + len(encoded)) % ALIGNMENT)
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC + len(encoded).to_bytes(8, 'little') + encoded)
+            for name, block in blocks:
+                file.write(block)
+                file.write(b"\0" * (-header['blocks'][name][1] % ALIGNMENT))
+        os.replace(temporary, path)  # Replaces the old snapshot in a single rename
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def open_snapshot(path, directory="."):
+    """Maps a snapshot file and returns an InventorySnapshot, or None if it is missing, unreadable or stale."""
+    try:
+        with open(path, 'rb') as file:
+            prefix = file.read(len(MAGIC) + 8)
+            if len(prefix) < len(MAGIC) + 8 or prefix[:len(MAGIC)] != MAGIC:
+                return None
+            length = int.from_bytes(prefix[len(MAGIC):], 'little')
+            header = json.loads(file.read(length))
+            if {key: header.get(key) for key in ('byteorder', 'itemsizes')} != layout():
+                return None
+            if header.get('sources') != source_stats(directory):
+                return None  # An input file has changed since the snapshot was written
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    data = memoryview(mapping)[len(MAGIC) + 8 + length:]
+    codes = dict(COLUMNS + TEXT_ID_BLOCKS)
+
+    def block(name):
+        offset, size = header['blocks'][name]
+        return data[offset:offset + size].cast(codes.get(name, 'q'))  # Index blocks hold rows
+
+    store = ColumnarInventory()
+    for name, code in COLUMNS:
+        if name in header['blocks']:
+            setattr(store, name, block(name))
+    if 'item_id_text' in header['blocks']:
+        offsets, text = block('item_id_offsets'), block('item_id_text')
+        store.item_ids, store.sorted_ids = TextIds(offsets, text), TextIds(offsets, text, store.sorted_rows)
+    store.manufacturers = header['manufacturers']
+    store.manufacturer_lookup = {name: code for code, name in enumerate(store.manufacturers)}
+    store.item_types = header['item_types']
+    store.item_type_lookup = {name: code for code, name in enumerate(store.item_types)}
+    store.damage_labels = dict(header['damage_labels'])
+    store.size = header['size']
+    store.mapping = mapping  # Keeps the file mapped for as long as the store is in use
+
+    indexes = {}
+    for name, description in header['indexes'].items():
+        rows = block(name)
+        field = description['field']
+        if description['groups'] is None:
+            indexes[name] = IndexGroup(store, rows, field)
+        else:
+            indexes[name] = {tuple(key) if len(key) > 1 else key[0]: IndexGroup(store, rows[first:end], field)
+                             for *key, first, end in description['groups']}
+    valid_until = header['index_valid_until']
+    return InventorySnapshot(store, indexes,
+                             datetime.datetime.fromisoformat(valid_until) if valid_until else None,
+                             datetime.date.fromisoformat(header['report_date']))
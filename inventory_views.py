@@ -0,0 +1,148 @@
+"""Sorted views of a processed inventory, shared by the report writers in part1.py and part2.py.
+
+Each ordering is a selection of the inventory: (item ID, item) pairs for a dictionary, rows for
+a ColumnarInventory. fields() turns a selection into the (item ID, manufacturer, item type,
+price, service date, damage label) fields the report lines are formatted from.
+"""
+
+from itertools import compress
+
+from columnar_inventory import ColumnarInventory
+from service_dates import format_service_date
+
+
+def views_for(inventory):
+    """Returns the sorted views of an inventory, ColumnarViews for a ColumnarInventory."""
+    if isinstance(inventory, ColumnarInventory):
+        return ColumnarViews(inventory)
+    return InventoryViews(inventory)
+
+
+class InventoryViews:
+    """Computes each report ordering of an inventory once, using stable O(n log n) sorts.
+
+    The inventory is walked a single time; each item is routed to every ordering that needs it,
+    and each ordering is sorted the first time it is asked for.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory  # Maps item ID to its details
+        self.routes = None  # Unsorted (item ID, item) pairs for each ordering, filled by route()
+        self.cache = {}  # Stores each ordering after it is first computed
+
+    def route(self):
+        """Walks the inventory once, routing every item to the orderings that need it."""
+        if self.routes is None:
+            everything = []  # Every item, for the full report
+            item_types = {}  # Items grouped by type in inventory order
+            dated = []  # Items that have a service date
+            damaged = []  # Items that are damaged
+            for item_id, item in self.inventory.items():
+                pair = (item_id, item)
+                everything.append(pair)
+                item_types.setdefault(item['ItemType'], []).append(pair)
+                if 'ServiceDate' in item:
+                    dated.append(pair)
+                if item['Damaged']:
+                    damaged.append(pair)
+            self.routes = {'everything': everything, 'item_type': item_types, 'dated': dated, 'damaged': damaged}
+        return self.routes
+
+    def item_types(self):
+        """Returns the item types in order of first appearance."""
+        return list(self.route()['item_type'])
+
+    def selection(self, item_ids):
+        """Returns the (item ID, item) pairs of the given item IDs."""
+        return [(item_id, self.inventory[item_id]) for item_id in item_ids]
+
+    def fields(self, pairs):
+        """Returns an iterator of the report fields of (item ID, item) pairs, with the price and service
+        date as report text ('N/A' when missing)."""
+        return ((item_id, item['Manufacturer'], item['ItemType'], item.get('Price', 'N/A'),
+                 format_service_date(item['ServiceDate']) if 'ServiceDate' in item else 'N/A', item['Damaged'])
+                for item_id, item in pairs)
+
+    def full_by_manufacturer(self):
+        """Returns every (item ID, item) pair sorted alphabetically by manufacturer."""
+        if 'manufacturer' not in self.cache:
+            self.cache['manufacturer'] = sorted(self.route()['everything'], key=lambda pair: pair[1]['Manufacturer'])
+        return self.cache['manufacturer']
+
+    def by_manufacturer(self):
+        """Returns a list of item IDs sorted alphabetically by manufacturer."""
+        return [item_id for item_id, item in self.full_by_manufacturer()]
+
+    def for_item_type(self, item_type):
+        """Returns the (item ID, item) pairs of one item type sorted by item ID."""
+        key = ('item_type', item_type)
+        if key not in self.cache:
+            items = self.route()['item_type'].get(item_type, [])
+            items.sort(key=lambda pair: pair[0])  # Sorts only this group
+            self.cache[key] = items
+        return self.cache[key]
+
+    def past_service_date(self, today):
+        """Returns (item ID, item) pairs whose service date is before today, oldest first.
+
+        Only the past items are sorted. The result depends on today, so it is not cached.
+        """
+        return sorted((pair for pair in self.route()['dated'] if pair[1]['ServiceDate'] < today),
+                      key=lambda pair: pair[1]['ServiceDate'])
+
+    def damaged_by_price(self):
+        """Returns damaged (item ID, item) pairs sorted by price from highest to lowest."""
+        if 'damaged' not in self.cache:
+            self.cache['damaged'] = sorted(self.route()['damaged'], key=lambda pair: pair[1].get('Price', 0), reverse=True)
+        return self.cache['damaged']
+
+
+class ColumnarViews:
+    """Computes each report ordering of a ColumnarInventory once, as a list of rows.
+
+    The rows are picked out with column scans and sorted by keys read from the columns, in
+    the same stable order InventoryViews gives a dictionary with the same items.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory  # The ColumnarInventory
+        self.cache = {}  # Stores each ordering after it is first computed
+
+    def item_types(self):
+        """Returns the item types of the live rows in order of first appearance."""
+        return [self.inventory.item_types[code] for code in dict.fromkeys(compress(self.inventory.item_type_codes, self.inventory.live))]
+
+    def selection(self, item_ids):
+        """Returns the rows of the given item IDs."""
+        return [self.inventory.find_row(item_id) for item_id in item_ids]
+
+    def fields(self, rows):
+        """Returns an iterator of the report fields of the rows, read straight from the columns."""
+        return self.inventory.report_fields(rows)
+
+    def full_by_manufacturer(self):
+        """Returns every row sorted alphabetically by manufacturer."""
+        if 'manufacturer' not in self.cache:
+            self.cache['manufacturer'] = self.inventory.rows_by_manufacturer()
+        return self.cache['manufacturer']
+
+    def by_manufacturer(self):
+        """Returns a list of item IDs sorted alphabetically by manufacturer."""
+        return list(map(self.inventory.id_at, self.full_by_manufacturer()))
+
+    def for_item_type(self, item_type):
+        """Returns the rows of one item type sorted by item ID."""
+        key = ('item_type', item_type)
+        if key not in self.cache:
+            self.cache[key] = self.inventory.rows_by_item_id(self.inventory.select_rows(item_type=item_type))
+        return self.cache[key]
+
+    def past_service_date(self, today):
+        """Returns the rows whose service date is before today, oldest first. Not cached."""
+        return self.inventory.rows_by_service_date(self.inventory.select_rows(serviced_before=today))
+
+    def damaged_by_price(self):
+        """Returns the damaged rows sorted by price from highest to lowest."""
+        if 'damaged' not in self.cache:
+            self.cache['damaged'] = self.inventory.rows_by_price(self.inventory.select_rows(damaged=True))
+        return self.cache['damaged']
@@ -0,0 +1,86 @@
+"""Writes the inventory reports across a pool of worker processes.
+
+Every report file is independent: the full, past service date and damaged reports, and one
+file per item type. Each becomes a task for the pool. Workers are forked where the platform
+allows it, so they share the inventory of the parent as it is, without copying or converting
+it. Elsewhere they receive it once, at start-up, as a ColumnarInventory whose arrays pickle
+as compact byte strings. Each worker sorts the items of its tasks with the same views as the
+serial path, so the files match it byte for byte.
+"""
+
+import datetime
+import multiprocessing
+from itertools import starmap
+
+from columnar_inventory import ColumnarInventory
+from inventory_views import views_for
+from report_writer import write_report
+
+worker_views = None  # Sorted views of the inventory of the current worker process, set by start_worker()
+
+
+def to_columnar(inventory):
+    """Returns the inventory as a ColumnarInventory, copying it in inventory order if needed."""
+    if isinstance(inventory, ColumnarInventory):
+        return inventory
+    return ColumnarInventory.from_inventory(inventory)
+
+
+def start_worker(inventory):
+    """Keeps the inventory sent to a newly started worker process."""
+    global worker_views
+    worker_views = views_for(inventory)
+
+
+def report_items(views, report, item_type, today):
+    """Returns the items of one report, in report order, as a selection of the views."""
+    if report == 'full':
+        return views.full_by_manufacturer()
+    if report == 'item_type':
+        return views.for_item_type(item_type)
+    if report == 'past_service_date':
+        return views.past_service_date(today)
+    return views.damaged_by_price()
+
+
+def item_types(inventory):
+    """Returns the item types of an inventory in order of first appearance."""
+    if isinstance(inventory, ColumnarInventory):
+        return views_for(inventory).item_types()
+    return list(dict.fromkeys(item['ItemType'] for item in inventory.values()))
+
+
+def run_task(task):
+    """Writes one report file in a worker process and returns its name."""
+    report, filename, item_type, format_line, today = task
+    items = report_items(worker_views, report, item_type, today)
+    write_report(filename, starmap(format_line, worker_views.fields(items)))
+    return filename
+
+
+def write_reports_in_parallel(inventory, format_lines, jobs, today=None):
+    """Writes every report using a pool of worker processes.
+
+    format_lines maps each report ('full', 'item_type', 'past_service_date', 'damaged') to
+    a picklable function that formats the line of an item from its report fields, as given
+    by the fields() of the inventory views. Returns the written file names.
+    """
+    today = today or datetime.datetime.now()
+    if 'fork' in multiprocessing.get_all_start_methods():  # The workers inherit the inventory as it is
+        context = multiprocessing.get_context('fork')
+    else:  # The inventory is pickled to each worker
+        context = multiprocessing.get_context()
+        inventory = to_columnar(inventory)
+
+    # One file per item type in order of first appearance; when two types share a file name,
+    # the later one wins, as it does serially
+    type_files = {}
+    for item_type in item_types(inventory):
+        type_files[f"{item_type.capitalize()}Inventory.txt"] = item_type
+    tasks = [('full', "FullInventory.txt", None, format_lines['full'], today)]
+    tasks += [('item_type', filename, item_type, format_lines['item_type'], today) for filename, item_type in type_files.items()]
+    tasks.append(('past_service_date', "PastServiceDateInventory.txt", None, format_lines['past_service_date'], today))
+    tasks.append(('damaged', "DamagedInventory.txt", None, format_lines['damaged'], today))
+
+    with context.Pool(jobs, initializer=start_worker, initargs=(inventory,)) as pool:
+        return list(pool.imap_unordered(run_task, tasks))
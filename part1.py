@@ -1,4 +1,17 @@
 import datetime  # Import the datetime module to work with dates and times
+import argparse  # Import the argparse module to read command line options
+import itertools  # Import the itertools module to format the report lines
+from columnar_inventory import ColumnarInventory  # Import the compact column-by-column inventory store
+from incremental_build import IncrementalBuild  # Import the snapshot-based incremental loader
+from inventory_views import views_for  # Import the shared sorted views used by the reports
+from parallel_reports import write_reports_in_parallel  # Import the process pool report writer
+from report_writer import write_report  # Import the buffered, atomic report file writer
+from service_dates import is_service_date, parse_service_date  # Import the memoized service date codec
+from stage_profiler import StageProfiler  # Import the stage timing and metrics export used by --profile
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # Number of bytes read from an input file at a time
+INPUT_FILES = ("ManufacturerList.txt", "PriceList.txt", "ServiceDatesList.txt")  # The input files, read by the load stage
+REPORT_FILES = ("FullInventory.txt", "PastServiceDateInventory.txt", "DamagedInventory.txt")  # The reports not split by item type
 def ReadTheFile(filename): #Function to read the input files
     """Reads a file and returns its content as a list of lists."""
     file = open(filename, 'r') #Opens the file name and gives it read permissions 
@@ -9,11 +22,36 @@ def ReadTheFile(filename): #Function to read the input files
         data.append(line.strip().split(',')) #Then, strip each line then split it wherever there is a comma, then append it to the data list
     return data #Return data
 
+def IsWholeNumber(Text): #Function that checks a price field
+    """Checks whether the text is a whole number that int() accepts."""
+    try:
+        int(Text) #The same conversion ProcessTheInventory makes, so a bad price is reported with its line
+    except ValueError:
+        return False
+    return True
+
+def StreamTheFile(filename, FieldCount, FieldChecks=None, ChunkSize=DEFAULT_CHUNK_SIZE): #Function to stream an input file
+    """Yields each line of a file as a list of fields without reading the whole file into memory."""
+    FieldChecks = FieldChecks or {} #Maps a field index to the function that checks it
+    with open(filename, 'r', buffering=ChunkSize) as file: #Reads at most ChunkSize bytes at a time
+        for LineNumber, line in enumerate(file, 1): #For each line, counting from 1
+            line = line.strip() #Strip the line
+            if not line: #Skip blank lines
+                continue
+            fields = line.split(',') #Split the line wherever there is a comma
+            if len(fields) < FieldCount or not fields[0].strip(): #Check that the line has an item ID and enough fields
+                raise ValueError(f"{filename}, line {LineNumber}: expected {FieldCount} comma-separated fields, got {line!r}")
+            for Index, Check in FieldChecks.items(): #Check the fields that need a particular format
+                if not Check(fields[Index].strip()):
+                    raise ValueError(f"{filename}, line {LineNumber}: invalid value {fields[Index].strip()!r} in field {Index + 1}")
+            yield fields #Hand the fields to the caller before reading the next line
+
 
 
-def ProcessTheInventory(ManufacturerList, PriceList, ServiceDatesList): #Function for processing the input files
-    """Processes the input lists into a structured dictionary."""
-    Inventory = {} #Create an empty dictionary to store inventory data
+def ProcessTheInventory(ManufacturerList, PriceList, ServiceDatesList, Inventory=None): #Function for processing the input files
+    """Processes the input lists into a structured dictionary, or into the given inventory store."""
+    if Inventory is None: #Unless another store such as a ColumnarInventory is given
+        Inventory = {} #Create an empty dictionary to store inventory data
     
     for item in ManufacturerList: #For loop that creates variables for Item ID, Manufacturer, Item Type, Damage Status
         ItemId = item[0].strip() #First Index is equal to the Item ID
@@ -29,125 +67,154 @@ def ProcessTheInventory(ManufacturerList, PriceList, ServiceDatesList): #Functio
     for item in PriceList: #For loop that iterates over each item in the PriceList and updates the Inventory dictionary with the corresponding prices.
         ItemId = item[0].strip()
         price = int(item[1].strip())
-        if ItemId in Inventory:
-            Inventory[ItemId]['Price'] = price
+        Details = Inventory.get(ItemId) #Look the item ID up once
+        if Details is not None:
+            Details['Price'] = price
     
     for item in ServiceDatesList: # For loop that iterates over each item in the ServiceDatesList and then updates the Inventory dictionary
         ItemID = item[0].strip()  # Extract and strip the Item ID from the first element of the item list
         ServiceDateString = item[1].strip()  # Extract and strip the service date string from the second element of the item list
-        ServiceDate = datetime.datetime.strptime(ServiceDateString, "%m/%d/%Y") if ServiceDateString else None  # Convert the service date string to a datetime object if it exists
-        if ItemID in Inventory:  # Check if the Item ID exists in the Inventory dictionary
-            Inventory[ItemID]['ServiceDate'] = ServiceDate #Update the ServiceDate field/key with a new value
+        ServiceDate = parse_service_date(ServiceDateString) if ServiceDateString else None  # Convert the service date string to a datetime object if it exists, reusing earlier conversions
+        Details = Inventory.get(ItemID)  # Look the Item ID up once
+        if Details is not None:  # Check if the Item ID exists in the Inventory dictionary
+            Details['ServiceDate'] = ServiceDate #Update the ServiceDate field/key with a new value
     
     return Inventory #Returns data added to the Inventory Dictionary
+
+def LoadTheInventory(Store=None, ChunkSize=DEFAULT_CHUNK_SIZE): #Function that loads the input files of the current directory
+    """Streams the three input files into an inventory dictionary, or into the given inventory store."""
+    # Stream the input files line by line; nothing is read until the inventory is processed
+    ManufacturerList = StreamTheFile("ManufacturerList.txt", 3, ChunkSize=ChunkSize)  # Stream the manufacturer list
+    PriceList = StreamTheFile("PriceList.txt", 2, {1: IsWholeNumber}, ChunkSize)  # Stream the price list
+    ServiceDatesList = StreamTheFile("ServiceDatesList.txt", 2, {1: is_service_date}, ChunkSize)  # Stream the service dates list
+    return ProcessTheInventory(ManufacturerList, PriceList, ServiceDatesList, Store)  # Process the lists into an inventory
 def SortByTheManufacturer(Inventory): #Function that sorts each item by its manufacturer
     """Returns a list of item IDs sorted alphabetically by manufacturer."""
-    ItemIds = list(Inventory.keys())                                    # Get a list of all item IDs from the inventory
-    for i in range(len(ItemIds)):                                       # Outer loop to iterate over each item ID
-        for j in range(i + 1, len(ItemIds)):                            # Inner loop to compare the current item ID with the rest
-            if Inventory[ItemIds[i]]['Manufacturer'] > Inventory[ItemIds[j]]['Manufacturer']: # Compare manufacturers
-                    ItemIds[i], ItemIds[j] = ItemIds[j], ItemIds[i]                            # Swap if the current manufacturer is greater
-    return ItemIds #Return the sorted list of item IDs
+    return views_for(Inventory).by_manufacturer() #Return the sorted list of item IDs
 
 def SortByItemID(items):
     """Sorts items by item ID."""
-    for i in range(len(items)):  # Outer loop to iterate over each item
-        for j in range(i + 1, len(items)):  # Inner loop to compare the current item with the rest
-            if items[i][0] > items[j][0]:  # Compare item IDs
-                items[i], items[j] = items[j], items[i]  # Swap if the current item ID is greater
+    items.sort(key=lambda item: item[0])  # Stable sort on the item ID
     return items  # Return the sorted list of items
 
 def SortByTheServiceDate(items): # Define a function to sort items by service date
     """Sorts items by service date from oldest to most recent."""  
-    for i in range(len(items)): # Outer loop to iterate over each item
-        for j in range(i + 1, len(items)): # Inner loop to compare the current item with the rest
-            if items[i][1]['ServiceDate'] > items[j][1]['ServiceDate']: # Compare service dates
-                items[i], items[j] = items[j], items[i] # Swap if the current service date is later
+    items.sort(key=lambda item: item[1]['ServiceDate']) # Stable sort on the service date
     return items # Return the sorted list of items
 
-def FullInventory(Inventory):  # Define a function to write the full inventory to a file
+def FullInventoryLine(ItemId, Manufacturer, ItemType, Price, ServiceDate, Damaged):  # Define a function to format a line of the full inventory
+    """Returns the FullInventory.txt line of an item from its report fields."""
+    return f"{ItemId}, {Manufacturer}, {Price}, {ServiceDate}" + (f", {Damaged}" if Damaged else "") + "\n"
+
+def ItemTypeLine(ItemId, Manufacturer, ItemType, Price, ServiceDate, Damaged):  # Define a function to format a line of an item type inventory
+    """Returns the line of an item in its item type inventory file from its report fields."""
+    return f"{ItemId}, {Manufacturer}, {Price}, {ServiceDate}" + (f", {Damaged}" if Damaged else "") + "\n"
+
+def PastServiceDateLine(ItemId, Manufacturer, ItemType, Price, ServiceDate, Damaged):  # Define a function to format a line of the past service date inventory
+    """Returns the PastServiceDateInventory.txt line of an item from its report fields."""
+    return f"{ItemId}, {Manufacturer}, {ItemType}, {Price}, {ServiceDate}" + (f", {Damaged}" if Damaged else "") + "\n"
+
+def DamagedLine(ItemId, Manufacturer, ItemType, Price, ServiceDate, Damaged):  # Define a function to format a line of the damaged inventory
+    """Returns the DamagedInventory.txt line of an item from its report fields."""
+    return f"{ItemId}, {Manufacturer}, {ItemType}, {Price}, {ServiceDate}\n"
+
+REPORT_LINES = {'full': FullInventoryLine, 'item_type': ItemTypeLine, 'past_service_date': PastServiceDateLine, 'damaged': DamagedLine}  # The line format of each report, for the parallel writer
+
+def FullInventory(Inventory, Views=None):  # Define a function to write the full inventory to a file
     """Writes FullInventory.txt sorted alphabetically by manufacturer."""
-    sorted_items = SortByTheManufacturer(Inventory)  # Sort the inventory items by manufacturer
-    file = open("FullInventory.txt", 'w')  # Open a file named "FullInventory.txt" in write mode
-    for ItemId in sorted_items:  # Iterate over each sorted item ID
-        item = Inventory[ItemId]  # Get the item details from the inventory
-        ServiceDateString = item.get('ServiceDate', 'N/A')  # Get the service date or 'N/A' if not available
-        if ServiceDateString != 'N/A':  # If the service date is available
-            ServiceDateString = item['ServiceDate'].strftime('%m/%d/%Y')  # Format the service date as a string
-        file.write(f"{ItemId}, {item['Manufacturer']}, {item.get('Price', 'N/A')}, {ServiceDateString}" + (f", {item['Damaged']}" if item['Damaged'] else "") + "\n")  # Write the item details to the file
-    file.close()  # Close the file
-
-def ItemTypeInventory(Inventory):
-    """Writes separate inventory files per item type, sorted by item ID."""
-    ItemTypes = {}  # Create an empty dictionary to store items by their type
-    for ItemId in Inventory:  # Iterate over each item in the inventory
-        item = Inventory[ItemId]  # Get the item details from the inventory
-        ItemType = item['ItemType']  # Get the item type
-        if ItemType not in ItemTypes:  # If the item type is not already in the dictionary
-            ItemTypes[ItemType] = []  # Create a new list for this item type
-        ItemTypes[ItemType].append((ItemId, item))  # Append the item ID and details to the list for this item type
+    Views = Views or views_for(Inventory)  # Reuse the shared sorted views when given
+    sorted_items = Views.full_by_manufacturer()  # Sort the inventory items by manufacturer
+    write_report("FullInventory.txt", itertools.starmap(FullInventoryLine, Views.fields(sorted_items)))  # Write the item details to the file
+
+def ItemTypeInventory(Inventory, Views=None, OnlyTypes=None):
+    """Writes separate inventory files per item type, sorted by item ID, or only those in OnlyTypes."""
+    Views = Views or views_for(Inventory)  # Reuse the shared sorted views when given
+    ItemTypes = Views.item_types()  # Item types in order of first appearance
     
-    for ItemType in ItemTypes:  # Iterate over each item type in the dictionary
-        sorted_items = SortByItemID(ItemTypes[ItemType])  # Sort the items by item ID
-        file = open(f"{ItemType.capitalize()}Inventory.txt", 'w')  # Open a file named after the item type in write mode
-        for ItemId, item in sorted_items:  # Iterate over each sorted item
-            ServiceDateString = item.get('ServiceDate', 'N/A')  # Get the service date or 'N/A' if not available
-            if ServiceDateString != 'N/A':  # If the service date is available
-                ServiceDateString = item['ServiceDate'].strftime('%m/%d/%Y')  # Format the service date as a string
-            file.write(f"{ItemId}, {item['Manufacturer']}, {item.get('Price', 'N/A')}, {ServiceDateString}" + (f", {item['Damaged']}" if item['Damaged'] else "") + "\n")  # Write the item details to the file with a blank line after each item
-        file.close()  # Close the file
-
-def PastServiceDateInventory(inventory):  # Define a function to write past service date inventory to a file
+    for ItemType in ItemTypes:  # Iterate over each item type
+        if OnlyTypes is not None and ItemType not in OnlyTypes:  # Skip the types that have not changed
+            continue
+        sorted_items = Views.for_item_type(ItemType)  # Items of this type sorted by item ID
+        # Write the item details to a file named after the item type
+        write_report(ItemTypeFileName(ItemType), itertools.starmap(ItemTypeLine, Views.fields(sorted_items)))
+
+def ItemTypeFileName(ItemType):  # Define a function that names the inventory file of an item type
+    """Returns the name of the inventory file of an item type."""
+    return f"{ItemType.capitalize()}Inventory.txt"
+
+def ItemTypeFiles(Views, OnlyTypes=None):  # Define a function that lists the files ItemTypeInventory writes
+    """Returns the names of the item type files that ItemTypeInventory writes."""
+    return [ItemTypeFileName(ItemType) for ItemType in Views.item_types() if OnlyTypes is None or ItemType in OnlyTypes]
+
+def PastServiceDateInventory(inventory, Views=None):  # Define a function to write past service date inventory to a file
     """Writes PastServiceDateInventory.txt sorted by oldest service date."""
-    past_service_items = []  # Create an empty list to store items with past service dates
-    for ItemId in inventory:  # Iterate over each item in the inventory
-        item = inventory[ItemId]  # Get the item details from the inventory
-        if 'ServiceDate' in item:  # Check if the item has a service date
-            past_service_items.append((ItemId, item))  # Append the item ID and details to the list
-    
-    sorted_items = SortByTheServiceDate(past_service_items)  # Sort the items by service date
-    file = open("PastServiceDateInventory.txt", 'w')  # Open a file named "PastServiceDateInventory.txt" in write mode
+    Views = Views or views_for(inventory)  # Reuse the shared sorted views when given
     today = datetime.datetime.now()  # Get the current date and time
-    for ItemId, item in sorted_items:  # Iterate over each sorted item
-        ServiceDateString = item['ServiceDate'].strftime('%m/%d/%Y')  # Format the service date as a string
-        if item['ServiceDate'] < today:  # Check if the service date is in the past
-            file.write(f"{ItemId}, {item['Manufacturer']}, {item['ItemType']}, {item.get('Price', 'N/A')}, {ServiceDateString}" + (f", {item['Damaged']}" if item['Damaged'] else "") + "\n")  # Write the item details to the file
-        else:  # If the service date is not in the past
-            'N/A'  # Do nothing
-    file.close()  # Close the file
-
-def DamagedInventory(Inventory):  # Define a function to write damaged inventory to a file
+    sorted_items = Views.past_service_date(today)  # Items whose service date has passed, filtered before sorting, oldest first
+    # Write the items whose service date is in the past to the file
+    write_report("PastServiceDateInventory.txt", itertools.starmap(PastServiceDateLine, Views.fields(sorted_items)))
+
+def DamagedInventory(Inventory, Views=None):  # Define a function to write damaged inventory to a file
     """Writes DamagedInventory.txt sorted by price from highest to lowest."""
-    damaged_items = []  # Create an empty list to store damaged items
-    for ItemId in Inventory:  # Iterate over each item in the inventory
-        item = Inventory[ItemId]  # Get the item details from the inventory
-        if item['Damaged']:  # Check if the item is damaged
-            damaged_items.append((ItemId, item))  # Append the item ID and details to the list
+    Views = Views or views_for(Inventory)  # Reuse the shared sorted views when given
+    damaged_items = Views.damaged_by_price()  # Damaged items sorted by price in descending order
+    write_report("DamagedInventory.txt", itertools.starmap(DamagedLine, Views.fields(damaged_items)))  # Write the item details to the file
+
+def main():  # Define the main function
+    parser = argparse.ArgumentParser(description="Writes the inventory reports.")  # Read the command line options
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes read from an input file at a time")
+    parser.add_argument("--incremental", nargs="?", const=".part1_snapshot.pickle", metavar="SNAPSHOT", help="apply input file changes to the snapshot of the last run and rewrite only the affected reports")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes used to write the reports")
+    parser.add_argument("--storage", choices=("dict", "columnar"), default="dict", help="how the inventory is held in memory")
+    parser.add_argument("--profile", metavar="FILE", help="write the wall and CPU time, rows, bytes and allocations of each stage to FILE")
+    parser.add_argument("--profile-format", choices=("json", "prometheus"), default="json", help="format of the --profile file")
+    parser.add_argument("--profile-capture", choices=("cprofile", "tracemalloc"), help="also profile the slowest stage, saved as FILE.<stage>.pstats or FILE.<stage>.tracemalloc.txt")
+    args = parser.parse_args()
 
-    def get_price(item):  # Define a helper function to get the price of an item
-        return item[1].get('Price', 0)  # Return the price of the item, or 0 if not available
+    Profiler = StageProfiler("part1", bool(args.profile), args.profile_capture)  # Measures each stage when --profile is given
 
-    damaged_items.sort(key=get_price, reverse=True)  # Sort the damaged items by price in descending order
-    
-    file = open("DamagedInventory.txt", 'w')  # Open a file named "DamagedInventory.txt" in write mode
-    for ItemId, item in damaged_items:  # Iterate over each sorted damaged item
-        ServiceDateString = item.get('ServiceDate', 'N/A')  # Get the service date or 'N/A' if not available
-        if ServiceDateString != 'N/A':  # If the service date is available
-            ServiceDateString = item['ServiceDate'].strftime('%m/%d/%Y')  # Format the service date as a string
-        file.write(f"{ItemId}, {item['Manufacturer']}, {item['ItemType']}, {item.get('Price', 'N/A')}, {ServiceDateString}\n")  # Write the item details to the file
-    file.close()  # Close the file
+    if args.incremental:  # Apply only what changed since the last run
+        Build = IncrementalBuild(args.incremental, new_inventory=ColumnarInventory if args.storage == "columnar" else dict)
+        with Profiler.stage("incremental_load", reads=INPUT_FILES) as Record:
+            Inventory, Changes = Build.load()
+            Record['rows'] = len(Inventory)
+        Views = views_for(Inventory)  # Walk the inventory once and share each ordering between the reports
+        if Changes.full_inventory:
+            with Profiler.stage("full_inventory", writes=["FullInventory.txt"]):
+                FullInventory(Inventory, Views)  # Write the full inventory to a file
+        if Changes.item_types is None or Changes.item_types:
+            with Profiler.stage("item_type_inventory", writes=lambda: ItemTypeFiles(Views, Changes.item_types)):
+                ItemTypeInventory(Inventory, Views, Changes.item_types)  # Write the changed inventory files per item type
+        if Changes.past_service_date:
+            with Profiler.stage("past_service_date_inventory", writes=["PastServiceDateInventory.txt"]):
+                PastServiceDateInventory(Inventory, Views)  # Write the past service date inventory to a file
+        if Changes.damaged:
+            with Profiler.stage("damaged_inventory", writes=["DamagedInventory.txt"]):
+                DamagedInventory(Inventory, Views)  # Write the damaged inventory to a file
+        with Profiler.stage("save_snapshot"):
+            Build.save()  # Remember this run for the next one
+    else:
+        with Profiler.stage("load_inventory", reads=INPUT_FILES) as Record:
+            Store = ColumnarInventory() if args.storage == "columnar" else None  # Pick the inventory store
+            Inventory = LoadTheInventory(Store, args.chunk_size)  # Stream the input files into the inventory
+            Record['rows'] = len(Inventory)
 
-def main():  # Define the main function
-    ManufacturerList = ReadTheFile("ManufacturerList.txt")  # Read the manufacturer list from the file
-    PriceList = ReadTheFile("PriceList.txt")  # Read the price list from the file
-    ServiceDatesList = ReadTheFile("ServiceDatesList.txt")  # Read the service dates list from the file
-    
-    Inventory = ProcessTheInventory(ManufacturerList, PriceList, ServiceDatesList)  # Process the lists into an inventory dictionary
-    
-    FullInventory(Inventory)  # Write the full inventory to a file
-    ItemTypeInventory(Inventory)  # Write separate inventory files per item type
-    PastServiceDateInventory(Inventory)  # Write the past service date inventory to a file
-    DamagedInventory(Inventory)  # Write the damaged inventory to a file
+        if args.jobs > 1:  # Write the independent report files across a pool of worker processes
+            Views = views_for(Inventory)  # Only used to name the files for the profile
+            with Profiler.stage("write_reports_in_parallel", writes=lambda: list(REPORT_FILES) + ItemTypeFiles(Views)):
+                write_reports_in_parallel(Inventory, REPORT_LINES, args.jobs)
+        else:
+            Views = views_for(Inventory)  # Walk the inventory once and share each ordering between the reports
+            with Profiler.stage("full_inventory", writes=["FullInventory.txt"]):
+                FullInventory(Inventory, Views)  # Write the full inventory to a file
+            with Profiler.stage("item_type_inventory", writes=lambda: ItemTypeFiles(Views)):
+                ItemTypeInventory(Inventory, Views)  # Write separate inventory files per item type
+            with Profiler.stage("past_service_date_inventory", writes=["PastServiceDateInventory.txt"]):
+                PastServiceDateInventory(Inventory, Views)  # Write the past service date inventory to a file
+            with Profiler.stage("damaged_inventory", writes=["DamagedInventory.txt"]):
+                DamagedInventory(Inventory, Views)  # Write the damaged inventory to a file
+    if args.profile:
+        Profiler.write(args.profile, args.profile_format)  # Write the measurements, and any capture beside them
     print("Inventory has been conducted for this.")  # Print a message indicating the inventory process is complete
 
 if __name__ == "__main__":
@@ -1,11 +1,69 @@
+import argparse  # Importing the argparse module for command line options
+import bisect  # Importing the bisect module for searching the sorted price indexes
 import datetime  # Importing the datetime module for date manipulation
+import itertools  # Importing the itertools module for paging query results
+import json  # Importing the json module for batch query results
+import operator  # Importing the operator module for filtering expired index entries
+import sys  # Importing the sys module for the batch query streams
+import time  # Importing the time module for measuring batch throughput
+from columnar_inventory import ColumnarInventory  # Importing the compact column-by-column inventory store
+from expiry_scheduler import ExpiryScheduler  # Importing the service date expiry queue
+from incremental_build import IncrementalBuild  # Importing the snapshot-based incremental loader
+from inventory_snapshot import IndexGroup, open_snapshot, save_snapshot, source_stats  # Importing the memory-mapped inventory snapshots
+from inventory_views import views_for  # Importing the shared sorted views used by the reports
+from parallel_reports import write_reports_in_parallel  # Importing the process pool report writer
+from report_writer import append_report, write_report  # Importing the buffered, atomic report file writer
+from service_dates import is_service_date, parse_service_date  # Importing the memoized service date codec
+from stage_profiler import StageProfiler  # Importing the stage timing and metrics export used by --profile
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # Number of bytes read from an input file at a time
+BATCH_MEMO_SIZE = 1 << 16  # Distinct query texts remembered while answering a batch
+COMPACT_RATIO = 4  # An index group is copied without its expired entries once more than 1/COMPACT_RATIO of it has expired
+INPUT_FILES = ("ManufacturerList.txt", "PriceList.txt", "ServiceDatesList.txt")  # The input files, read when loading
+REPORT_FILES = ("FullInventory.txt", "PastServiceDateInventory.txt", "DamagedInventory.txt")  # The reports not split by item type
+
 
 class InventoryManager:
     """Manages inventory: file reading, processing, saving, and user querying."""
 
-    def __init__(self):
-        # Initializes the inventory dictionary to store item details
-        self.inventory = {}
+    # Query words shorter than this are never corrected as typos
+    TYPO_MIN_LENGTH = 4
+
+    def __init__(self, inventory=None, clock=datetime.datetime.now):
+        # Initializes the inventory dictionary to store item details, unless another store is given
+        self.inventory = {} if inventory is None else inventory
+        # Returns the current date and time; replaceable for testing
+        self.clock = clock
+        # Report orderings of the inventory, computed on first use
+        self.views = None
+        # Valid items keyed by (manufacturer, item type) and by item type, each sorted by price
+        self.query_index = {}
+        self.type_index = {}
+        # Every valid item sorted by price, and valid items sorted by service date, by item type and overall
+        self.price_index = []
+        self.type_date_index = {}
+        self.date_index = []
+        # Earliest service date in the indexes; its items leave the indexes once it has passed
+        self.index_valid_until = None
+        # Counts index rebuilds, reloads and expiries, so that cached answers can tell when they are stale
+        self.index_generation = 0
+        # Releases the indexed items in service date order as they pass their service date
+        self.expiry = ExpiryScheduler(clock=clock)
+        # Maps the position of each expired item to the expiry that removed it. The price-sorted
+        # indexes keep its entries, skipped by the queries, until enough of a group has expired
+        self.expired = {}
+        self.expiry_count = 0  # Number of expiries that removed items
+        self.expired_entries = {}  # Maps (index name, group key) to the number of expired entries it holds
+        # When PastServiceDateInventory.txt was last brought up to date, the earliest service date
+        # still to join it, and once one has, the dated items still to join it
+        self.past_service_since = None
+        self.past_service_next = None
+        self.past_service_expiry = None
+        # Maps each normalized manufacturer or item type phrase to its roles and names
+        self.vocabulary = {}
+        self.vocabulary_max_words = 1  # Number of words in the longest phrase
+        # Maps each one-letter deletion of a single-word phrase back to the phrases it came from
+        self.typo_index = {}
 
     def read_file(self, filename):
         """Reads a file and returns its content as a list of lists."""
@@ -17,6 +75,38 @@ class InventoryManager:
             data.append(line.strip().split(','))  # Splits the line by commas and adds to the list
         return data  # Returns the processed data
 
+    def is_whole_number(self, text):
+        """Checks whether the text is a whole number that int() accepts."""
+        try:
+            int(text)  # The same conversion process_inventory makes, so a bad price is reported with its line
+        except ValueError:
+            return False
+        return True
+
+    def stream_file(self, filename, field_count, field_checks=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yields each line of a file as a list of fields without reading the whole file into memory."""
+        field_checks = field_checks or {}  # Maps a field index to the function that checks it
+        with open(filename, 'r', buffering=chunk_size) as file:  # Reads at most chunk_size bytes at a time
+            for line_number, line in enumerate(file, 1):  # Iterates through the lines, counting from 1
+                line = line.strip()  # Strips the line
+                if not line:  # Skips blank lines
+                    continue
+                fields = line.split(',')  # Splits the line by commas
+                if len(fields) < field_count or not fields[0].strip():  # Checks for an item ID and enough fields
+                    raise ValueError(f"{filename}, line {line_number}: expected {field_count} comma-separated fields, got {line!r}")
+                for index, check in field_checks.items():  # Checks the fields that need a particular format
+                    if not check(fields[index].strip()):
+                        raise ValueError(f"{filename}, line {line_number}: invalid value {fields[index].strip()!r} in field {index + 1}")
+                yield fields  # Hands the fields over before reading the next line
+
+    def load_inventory(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Streams the three input files into the inventory."""
+        self.process_inventory(
+            self.stream_file("ManufacturerList.txt", 3, chunk_size=chunk_size),
+            self.stream_file("PriceList.txt", 2, {1: self.is_whole_number}, chunk_size),
+            self.stream_file("ServiceDatesList.txt", 2, {1: is_service_date}, chunk_size),
+        )
+
     def process_inventory(self, manufacturer_list, price_list, service_dates_list):
         """Processes the input lists into a structured inventory dictionary."""
         for item in manufacturer_list:  # Iterates through the manufacturer list
@@ -34,217 +124,781 @@ class InventoryManager:
         for item in price_list:  # Iterates through the price list
             ItemId = item[0].strip()  # Extracts and trims the item ID
             Price = int(item[1].strip())  # Extracts and converts the price to an integer
-            if ItemId in self.inventory:  # Checks if the item ID exists in the inventory
-                self.inventory[ItemId]['Price'] = Price  # Adds the price to the inventory
+            details = self.inventory.get(ItemId)  # Looks the item ID up once
+            if details is not None:  # Checks if the item ID exists in the inventory
+                details['Price'] = Price  # Adds the price to the inventory
 
         for item in service_dates_list:  # Iterates through the service dates list
             ItemId = item[0].strip()  # Extracts and trims the item ID
             ServiceDateString = item[1].strip()  # Extracts and trims the service date string
             # Converts the service date string to a datetime object
-            ServiceDate = datetime.datetime.strptime(ServiceDateString, "%m/%d/%Y") if ServiceDateString else None
-            if ItemId in self.inventory:  # Checks if the item ID exists in the inventory
-                self.inventory[ItemId]['ServiceDate'] = ServiceDate  # Adds the service date to the inventory
+            ServiceDate = parse_service_date(ServiceDateString) if ServiceDateString else None
+            details = self.inventory.get(ItemId)  # Looks the item ID up once
+            if details is not None:  # Checks if the item ID exists in the inventory
+                details['ServiceDate'] = ServiceDate  # Adds the service date to the inventory
+
+        self.index_inventory()  # Prepares the processed inventory for reports and queries
+
+    def index_inventory(self):
+        """Builds the lookup structures of a newly loaded inventory."""
+        self.views = None  # Discards orderings of the previous inventory
+        self.past_service_next = None  # Tracked again once the report is written or found current
+        self.build_vocabulary()  # Indexes the manufacturer and item type names
+        self.build_query_index()  # Indexes the valid items for answering queries
+
+    def build_vocabulary(self, manufacturers=None, item_types=None):
+        """Builds the lookup table of manufacturer and item type phrases used to parse queries.
+
+        The names are collected from the inventory unless both lists of names are given.
+        """
+        if (manufacturers is None or item_types is None) and isinstance(self.inventory, ColumnarInventory):
+            manufacturers, item_types = self.inventory.names_in_use()  # Each name once, read from the columns
+        elif manufacturers is None or item_types is None:
+            manufacturers, item_types = [], []
+            for item in self.inventory.values():  # Iterates through the inventory once
+                manufacturers.append(item['Manufacturer'])
+                item_types.append(item['ItemType'])
+        vocabulary = {}  # Maps phrase to {role: normalized name}
+        for role, names in (('manufacturer', manufacturers), ('item_type', item_types)):
+            for name in names:
+                phrase = ' '.join(name.lower().split())  # Normalizes case and spacing
+                if phrase:
+                    vocabulary.setdefault(phrase, {})[role] = name.lower()
+
+        typo_index = {}  # Maps deletion variants to the phrases they came from
+        for phrase in vocabulary:
+            if ' ' not in phrase and len(phrase) >= self.TYPO_MIN_LENGTH:
+                for variant in self.deletion_variants(phrase):
+                    typo_index.setdefault(variant, set()).add(phrase)
+
+        self.vocabulary = vocabulary
+        self.vocabulary_max_words = max((phrase.count(' ') + 1 for phrase in vocabulary), default=1)
+        self.typo_index = typo_index
+
+    def deletion_variants(self, word):
+        """Returns the word and every string made by deleting one of its letters."""
+        return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+    def within_one_edit(self, first, second):
+        """Checks whether two words differ by one insertion, deletion, substitution or adjacent swap."""
+        if abs(len(first) - len(second)) > 1:
+            return False
+        if len(first) == len(second):
+            diffs = [i for i in range(len(first)) if first[i] != second[i]]  # Positions that differ
+            if len(diffs) <= 1:
+                return True
+            return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                    and first[diffs[0]] == second[diffs[1]] and first[diffs[1]] == second[diffs[0]])
+        if len(first) > len(second):  # Makes the first word the shorter one
+            first, second = second, first
+        for i in range(len(second)):  # Tries deleting each letter of the longer word
+            if second[:i] + second[i + 1:] == first:
+                return True
+        return False
+
+    def correct_typo(self, word):
+        """Returns the single vocabulary phrase within one edit of the word, or None."""
+        if len(word) < self.TYPO_MIN_LENGTH:
+            return None
+        candidates = set()  # Phrases sharing a deletion variant with the word
+        for variant in self.deletion_variants(word):
+            candidates |= self.typo_index.get(variant, set())
+        matches = [phrase for phrase in candidates if self.within_one_edit(word, phrase)]
+        return matches[0] if len(matches) == 1 else None
+
+    def build_query_index(self):
+        """Builds the price- and date-sorted indexes of items that are not damaged and within service date."""
+        today = self.clock()  # Gets the current date and time
+        query_index = {}  # Maps (manufacturer, item type) to its valid items
+        type_index = {}  # Maps item type to its valid items
+        price_index = []  # Every valid item
+        type_date_index = {}  # Maps item type to its valid items, by service date
+        date_index = []  # Every valid item, by service date
+
+        if isinstance(self.inventory, ColumnarInventory):  # Scans the columns rather than the records
+            candidates = self.inventory.query_candidates(today)
+        else:
+            candidates = self.query_candidates(today)
+        for price, position, item_id, service_date, manufacturer, item_type in candidates:
+            # The position keeps ties in inventory order, as the original scans did
+            entry = (price, position, item_id)
+            query_index.setdefault((manufacturer, item_type), []).append(entry)
+            type_index.setdefault(item_type, []).append(entry)
+            price_index.append(entry)
+            dated = (service_date, position, item_id)
+            type_date_index.setdefault(item_type, []).append(dated)
+            date_index.append(dated)
+
+        for entries in query_index.values():  # Sorts each group by price
+            entries.sort()
+        for entries in type_index.values():
+            entries.sort()
+        price_index.sort()
+        for entries in type_date_index.values():  # Sorts each group by service date
+            entries.sort()
+        date_index.sort()
+
+        self.query_index = query_index
+        self.type_index = type_index
+        self.price_index = price_index
+        self.type_date_index = type_date_index
+        self.date_index = date_index
+        self.expiry = ExpiryScheduler(ordered=date_index, clock=self.clock)  # The date index is already in expiry order
+        self.expired = {}
+        self.expired_entries = {}
+        self.index_valid_until = self.expiry.next_due()
+        self.index_generation += 1
+
+    def query_candidates(self, today):
+        """Yields (price, position, item ID, service date, manufacturer, item type) for the items that are
+        not damaged and have a price and a service date after today, with the names in lower case."""
+        for position, (item_id, item) in enumerate(self.inventory.items()):  # Iterates through the inventory once
+            service_date = item.get('ServiceDate')  # Gets the service date if available
+            if item['Damaged'] or service_date is None or 'Price' not in item or not service_date > today:
+                continue  # Skips items that can never be a match
+            yield item['Price'], position, item_id, service_date, item['Manufacturer'].lower(), item['ItemType'].lower()
+
+    def refresh_query_index(self):
+        """Brings the query indexes up to the current time.
+
+        Costs a clock reading and a comparison until an item's service date is reached.
+        """
+        now = self.clock()
+        if self.index_valid_until is not None and now >= self.index_valid_until:
+            self.expire_items(now)
+
+    def expire_items(self, now):
+        """Removes the items whose service date is no longer after now from the price-sorted query indexes.
+
+        The items are marked as expired, which costs O(1) each, and the queries skip them. A
+        group is copied without its expired entries once more than 1/COMPACT_RATIO of it has
+        expired, so results being read from the old group, such as a paused
+        items_in_price_range, are unaffected. The service-date-sorted indexes keep their
+        entries; their queries skip the dates that have passed.
+        """
+        expired = self.expiry.pop_due(now)
+        self.index_valid_until = self.expiry.next_due()
+        if not expired:
+            return
+        self.expiry_count += 1
+        counts = {}  # Maps (index name, group key) to its number of newly expired entries
+        for service_date, position, item_id in expired:
+            item = self.inventory[item_id]
+            item_type = item['ItemType'].lower()
+            self.expired[position] = self.expiry_count
+            for group in (('query_index', (item['Manufacturer'].lower(), item_type)), ('type_index', item_type), ('price_index', None)):
+                counts[group] = counts.get(group, 0) + 1
+        for group, count in counts.items():
+            count += self.expired_entries.get(group, 0)
+            if count * COMPACT_RATIO > len(self.index_group(*group)):
+                self.compact_group(*group)
+            else:
+                self.expired_entries[group] = count
+        self.index_generation += 1  # Cached answers may name an expired item
+
+    def index_group(self, name, key):
+        """Returns a price-sorted index group by index name and group key (None for the price index)."""
+        index = getattr(self, name)
+        return index if key is None else index.get(key, ())
+
+    def compact_group(self, name, key):
+        """Replaces a price-sorted index group with a copy that leaves out its expired entries."""
+        self.expired_entries.pop((name, key), None)
+        if key is None:
+            self.price_index = self.without_expired(self.price_index)
+            return
+        index = getattr(self, name)
+        if key not in index:
+            return
+        remaining = self.without_expired(index[key])
+        if len(remaining):
+            index[key] = remaining
+        else:  # Leaves no empty groups, as a rebuild would
+            del index[key]
+
+    def compact_indexes(self):
+        """Copies each price-sorted index group holding expired entries without them."""
+        for name, key in list(self.expired_entries):
+            self.compact_group(name, key)
+
+    def without_expired(self, entries):
+        """Returns a copy of price-sorted index entries leaving out those of expired items."""
+        if isinstance(entries, IndexGroup):  # Keeps snapshot entries as rows of the mapped store
+            return entries.without(self.expired)
+        live = map(operator.not_, map(self.expired.__contains__, map(operator.itemgetter(1), entries)))
+        return list(itertools.compress(entries, live))
+
+    def update_past_service_date_report(self):
+        """Appends the items whose service date has passed since it was written to PastServiceDateInventory.txt.
+
+        Their service dates are later than those of the items already in the report, so it
+        stays in order without being read or rewritten. Costs a clock reading and a
+        comparison until an item's service date has passed.
+        """
+        now = self.clock()
+        if self.past_service_next is None or not now > self.past_service_next:
+            return
+        if self.past_service_expiry is None:  # The first items to pass since the report was written
+            self.past_service_expiry = ExpiryScheduler(self.upcoming_service_dates(self.past_service_since),
+                                                       inclusive=False, clock=self.clock)
+        due = self.past_service_expiry.pop_due(now)
+        self.past_service_next = self.past_service_expiry.next_due()
+        views = self.get_views()
+        due_items = views.selection(item_id for service_date, position, item_id in due)
+        append_report("PastServiceDateInventory.txt", itertools.starmap(self.past_service_date_line, views.fields(due_items)))
+
+    def get_views(self):
+        """Returns the shared sorted views of the inventory, creating them on first use."""
+        if self.views is None or self.views.inventory is not self.inventory:
+            self.views = views_for(self.inventory)
+        return self.views
 
     def sort_by_manufacturer(self):
         """Returns a list of item IDs sorted alphabetically by manufacturer."""
-        item_ids = list(self.inventory.keys())  # Gets all item IDs from the inventory
-        # Bubble sort to sort item IDs by manufacturer name
-        for i in range(len(item_ids)):
-            for j in range(i + 1, len(item_ids)):
-                if self.inventory[item_ids[i]]['Manufacturer'] > self.inventory[item_ids[j]]['Manufacturer']:
-                    item_ids[i], item_ids[j] = item_ids[j], item_ids[i]  # Swaps the item IDs
-        return item_ids  # Returns the sorted list of item IDs
+        return list(self.get_views().by_manufacturer())  # Returns the sorted list of item IDs
 
     def sort_by_item_id(self, items):
         """Sorts items by item ID."""
-        # Bubble sort to sort items by item ID
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                if items[i][0] > items[j][0]:
-                    items[i], items[j] = items[j], items[i]  # Swaps the items
+        items.sort(key=lambda item: item[0])  # Stable sort on the item ID
         return items  # Returns the sorted list of items
 
     def sort_by_service_date(self, items):
         """Sorts items by service date from oldest to most recent."""
-        # Bubble sort to sort items by service date
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                if items[i][1]['ServiceDate'] > items[j][1]['ServiceDate']:
-                    items[i], items[j] = items[j], items[i]  # Swaps the items
+        items.sort(key=lambda item: item[1]['ServiceDate'])  # Stable sort on the service date
         return items  # Returns the sorted list of items
 
+    def full_inventory_line(self, item_id, manufacturer, item_type, price, service_date, damaged):
+        """Returns the FullInventory.txt line of an item from its report fields."""
+        return f"{item_id}, {manufacturer}, {item_type}, {price}, {service_date}" + (f", {damaged}" if damaged else "") + "\n"
+
+    def item_type_line(self, item_id, manufacturer, item_type, price, service_date, damaged):
+        """Returns the line of an item in its item type inventory file from its report fields."""
+        return f"{item_id}, {manufacturer}, {price}, {service_date}" + (f", {damaged}" if damaged else "") + "\n"
+
+    def past_service_date_line(self, item_id, manufacturer, item_type, price, service_date, damaged):
+        """Returns the PastServiceDateInventory.txt line of an item from its report fields."""
+        return f"{item_id}, {manufacturer}, {item_type}, {price}, {service_date}\n"
+
+    def damaged_line(self, item_id, manufacturer, item_type, price, service_date, damaged):
+        """Returns the DamagedInventory.txt line of an item from its report fields."""
+        return f"{item_id}, {manufacturer}, {item_type}, {price}, {service_date}\n"
+
     def full_inventory(self):
         """Writes FullInventory.txt sorted alphabetically by manufacturer."""
-        sorted_items = self.sort_by_manufacturer()  # Sorts items by manufacturer
-        file = open("FullInventory.txt", 'w')  # Opens the output file in write mode
-        for item_id in sorted_items:  # Iterates through the sorted item IDs
-            item = self.inventory[item_id]  # Retrieves the item details
-            service_date_string = item.get('ServiceDate', 'N/A')  # Gets the service date or 'N/A'
-            if service_date_string != 'N/A':  # Formats the service date if available
-                service_date_string = item['ServiceDate'].strftime('%m/%d/%Y')
-            # Writes the item details to the file
-            file.write(f"{item_id}, {item['Manufacturer']}, {item['ItemType']}, {item.get('Price', 'N/A')}, {service_date_string}" + (f", {item['Damaged']}" if item['Damaged'] else "") + "\n")
-        file.close()  # Closes the file
-
-    def item_type_inventory(self):
-        """Writes separate inventory files per item type, sorted by item ID."""
-        item_types = {}  # Initializes a dictionary to group items by type
-        for item_id in self.inventory:  # Iterates through the inventory
-            item = self.inventory[item_id]  # Retrieves the item details
-            item_type = item['ItemType']  # Gets the item type
-            if item_type not in item_types:  # Creates a new list for the item type if not already present
-                item_types[item_type] = []
-            item_types[item_type].append((item_id, item))  # Adds the item to the corresponding list
-
-        for item_type in item_types:  # Iterates through each item type
-            sorted_items = self.sort_by_item_id(item_types[item_type])  # Sorts items by item ID
-            file = open(f"{item_type.capitalize()}Inventory.txt", 'w')  # Opens the output file for the item type
-            for item_id, item in sorted_items:  # Iterates through the sorted items
-                service_date_string = item.get('ServiceDate', 'N/A')  # Gets the service date or 'N/A'
-                if service_date_string != 'N/A':  # Formats the service date if available
-                    service_date_string = item['ServiceDate'].strftime('%m/%d/%Y')
-                # Writes the item details to the file
-                file.write(f"{item_id}, {item['Manufacturer']}, {item.get('Price', 'N/A')}, {service_date_string}" + (f", {item['Damaged']}" if item['Damaged'] else "") + "\n")
-            file.close()  # Closes the file
+        views = self.get_views()
+        sorted_items = views.full_by_manufacturer()  # Items sorted by manufacturer
+        # Writes the item details to the file
+        write_report("FullInventory.txt", itertools.starmap(self.full_inventory_line, views.fields(sorted_items)))
+
+    def item_type_inventory(self, only_types=None):
+        """Writes separate inventory files per item type, sorted by item ID, or only those in only_types."""
+        views = self.get_views()
+
+        for item_type in views.item_types():  # Iterates through each item type
+            if only_types is not None and item_type not in only_types:  # Skips the types that have not changed
+                continue
+            sorted_items = views.for_item_type(item_type)  # Items of this type sorted by item ID
+            # Writes the item details to the file for the item type
+            write_report(self.item_type_file_name(item_type), itertools.starmap(self.item_type_line, views.fields(sorted_items)))
+
+    def item_type_file_name(self, item_type):
+        """Returns the name of the inventory file of an item type."""
+        return f"{item_type.capitalize()}Inventory.txt"
+
+    def item_type_files(self, only_types=None):
+        """Returns the names of the item type files that item_type_inventory(only_types) writes."""
+        return [self.item_type_file_name(item_type) for item_type in self.get_views().item_types()
+                if only_types is None or item_type in only_types]
 
     def past_service_date_inventory(self):
-        """Writes PastServiceDateInventory.txt sorted by oldest service date."""
-        today = datetime.datetime.now()  # Gets the current date and time
-        past_service_items = []  # Initializes a list to store past service items
-        for item_id in self.inventory:  # Iterates through the inventory
-            item = self.inventory[item_id]  # Retrieves the item details
-            if 'ServiceDate' in item:  # Checks if the item has a service date
-                past_service_items.append((item_id, item))  # Adds the item to the list
-
-        sorted_items = self.sort_by_service_date(past_service_items)  # Sorts items by service date
-        file = open("PastServiceDateInventory.txt", 'w')  # Opens the output file in write mode
-        for item_id, item in sorted_items:  # Iterates through the sorted items
-            if item['ServiceDate'] < today:  # Checks if the service date is in the past
-                service_date_string = item['ServiceDate'].strftime('%m/%d/%Y')  # Formats the service date
-                # Writes the item details to the file
-                file.write(f"{item_id}, {item['Manufacturer']}, {item['ItemType']}, {item.get('Price', 'N/A')}, {service_date_string}\n")
-        file.close()  # Closes the file
+        """Writes PastServiceDateInventory.txt sorted by oldest service date.
+
+        Only the items whose service date has passed are sorted. The others are tracked, and
+        update_past_service_date_report appends them to the report as they pass.
+        """
+        today = self.clock()  # Gets the current date and time
+        self.track_past_service_date(today)
+        views = self.get_views()
+        sorted_items = views.past_service_date(today)  # Stable, so ties keep inventory order
+        # Writes the items whose service date is in the past to the file
+        write_report("PastServiceDateInventory.txt", itertools.starmap(self.past_service_date_line, views.fields(sorted_items)))
+
+    def track_past_service_date(self, today):
+        """Keeps PastServiceDateInventory.txt, as written at the time today, up to date from now on.
+
+        Only the earliest service date still to pass is looked up here. Once it has passed,
+        update_past_service_date_report puts the dated items still to join the report into an expiry heap.
+        """
+        if isinstance(self.inventory, ColumnarInventory):  # Scans the service date column alone
+            next_date = self.inventory.next_service_date(today)
+        else:
+            next_date = min((item['ServiceDate'] for item_id, item in self.get_views().route()['dated']
+                             if not item['ServiceDate'] < today), default=None)
+        self.past_service_since = today
+        self.past_service_next = next_date
+        self.past_service_expiry = None
+
+    def upcoming_service_dates(self, today):
+        """Returns (service date, position, item ID) for the dated items whose service date is not before today."""
+        if isinstance(self.inventory, ColumnarInventory):  # Scans the service date column alone
+            return self.inventory.service_dates_from(today)
+        return [(item['ServiceDate'], position, item_id)  # Dated items in inventory order
+                for position, (item_id, item) in enumerate(self.get_views().route()['dated'])
+                if not item['ServiceDate'] < today]
 
     def damaged_inventory(self):
         """Writes DamagedInventory.txt sorted by price from highest to lowest."""
-        damaged_items = []  # Initializes a list to store damaged items
-        for item_id in self.inventory:  # Iterates through the inventory
-            item = self.inventory[item_id]  # Retrieves the item details
-            if item['Damaged']:  # Checks if the item is damaged
-                damaged_items.append((item_id, item))  # Adds the item to the list
-
-        # Manual descending sort by price
-        for i in range(len(damaged_items)):
-            for j in range(i + 1, len(damaged_items)):
-                if damaged_items[i][1].get('Price', 0) < damaged_items[j][1].get('Price', 0):
-                    damaged_items[i], damaged_items[j] = damaged_items[j], damaged_items[i]  # Swaps the items
-
-        file = open("DamagedInventory.txt", 'w')  # Opens the output file in write mode
-        for item_id, item in damaged_items:  # Iterates through the sorted damaged items
-            service_date_string = item.get('ServiceDate', 'N/A')  # Gets the service date or 'N/A'
-            if service_date_string != 'N/A':  # Formats the service date if available
-                service_date_string = item['ServiceDate'].strftime('%m/%d/%Y')
-            # Writes the item details to the file
-            file.write(f"{item_id}, {item['Manufacturer']}, {item['ItemType']}, {item.get('Price', 'N/A')}, {service_date_string}\n")
-        file.close()  # Closes the file
+        views = self.get_views()
+        damaged_items = views.damaged_by_price()  # Damaged items sorted by price, highest first
+        # Writes the item details to the file
+        write_report("DamagedInventory.txt", itertools.starmap(self.damaged_line, views.fields(damaged_items)))
+
+    def write_reports(self, jobs=1):
+        """Writes every inventory report, across a pool of jobs worker processes if jobs > 1."""
+        if jobs > 1:
+            today = self.clock()  # Shared by the workers and the tracking of the past service date report
+            # The line formatters of a fresh manager pickle without dragging the inventory along
+            formatter = InventoryManager()
+            write_reports_in_parallel(self.inventory, {
+                'full': formatter.full_inventory_line,
+                'item_type': formatter.item_type_line,
+                'past_service_date': formatter.past_service_date_line,
+                'damaged': formatter.damaged_line,
+            }, jobs, today)
+            self.track_past_service_date(today)
+        else:
+            self.full_inventory()
+            self.item_type_inventory()
+            self.past_service_date_inventory()
+            self.damaged_inventory()
+
+    def load_incremental(self, snapshot_path, new_inventory=dict):
+        """Applies the input file changes since the last run to its snapshot and writes the affected reports."""
+        build = IncrementalBuild(snapshot_path, new_inventory=new_inventory)
+        today = self.clock()
+        self.inventory, changes = build.load(today)
+        self.index_inventory()
+        if changes.full_inventory:
+            self.full_inventory()
+        if changes.item_types is None or changes.item_types:
+            self.item_type_inventory(changes.item_types)
+        if changes.past_service_date:
+            self.past_service_date_inventory()
+        else:  # The report of the last run is current
+            self.track_past_service_date(today)
+        if changes.damaged:
+            self.damaged_inventory()
+        build.save()  # Remembers this run for the next one
+        return changes
+
+    def save_snapshot(self, path, sources):
+        """Saves the inventory and query indexes to a snapshot file for the next session.
+
+        sources is the source_stats() of the input files taken before they were loaded.
+        """
+        self.compact_indexes()  # Saves only the entries of items that have not expired
+        save_snapshot(path, self.inventory, self.index_tables(), self.index_valid_until, sources, self.clock().date())
+
+    def index_tables(self):
+        """Returns each query index by attribute name, with the field its entries are sorted on."""
+        return {
+            'query_index': ('Price', self.query_index),
+            'type_index': ('Price', self.type_index),
+            'price_index': ('Price', self.price_index),
+            'type_date_index': ('ServiceDate', self.type_date_index),
+            'date_index': ('ServiceDate', self.date_index),
+        }
+
+    def open_snapshot(self, path):
+        """Opens a snapshot file in place of loading the input files.
+
+        Returns the day the reports were written alongside the snapshot, or None (leaving the
+        manager untouched) if the snapshot is missing or an input file has changed since.
+        The inventory stays mapped from the file and cannot be modified.
+        """
+        snapshot = open_snapshot(path)
+        if snapshot is None or snapshot.indexes.keys() != self.index_tables().keys():
+            return None
+        self.inventory = snapshot.inventory
+        self.views = None
+        self.past_service_next = None
+        self.build_vocabulary(snapshot.inventory.manufacturers, snapshot.inventory.item_types)
+        for name, index in snapshot.indexes.items():
+            setattr(self, name, index)
+        self.index_valid_until = snapshot.index_valid_until
+        # The date index keeps the items that had expired when the snapshot was saved, before the
+        # earliest date still indexed; items that expired since are released on first use
+        if self.index_valid_until is None:
+            start = len(self.date_index)
+        else:
+            start = bisect.bisect_left(self.date_index, (self.index_valid_until,))
+        self.expiry = ExpiryScheduler(ordered=self.date_index, clock=self.clock, start=start)
+        self.expired = {}
+        self.expired_entries = {}
+        self.index_generation += 1
+        return snapshot.report_date
 
     def find_best_match(self, manufacturer, item_type):
         """Finds the best item matching manufacturer and item type."""
-        today = datetime.datetime.now()  # Gets the current date and time
-        matched_items = []  # Initializes a list to store matched items
-
-        for item_id, item in self.inventory.items():  # Iterates through the inventory
-            # Checks if the item matches the manufacturer and item type, is not damaged, and is within service date
-            if item['Manufacturer'].lower() == manufacturer.lower() and item['ItemType'].lower() == item_type.lower():
-                if not item['Damaged'] and item['ServiceDate'] > today:
-                    matched_items.append((item_id, item))  # Adds the item to the matched list
-
-        if matched_items:  # Checks if there are matched items
-            most_expensive = matched_items[0]  # Initializes the most expensive item
-            for item in matched_items:  # Iterates through the matched items
-                if item[1]['Price'] > most_expensive[1]['Price']:  # Finds the most expensive item
-                    most_expensive = item
-            return most_expensive  # Returns the most expensive item
+        self.refresh_query_index()  # Drops items that have passed their service date
+        entries = self.query_index.get((manufacturer.lower(), item_type.lower()))  # Looks up the matching items
+
+        last = self.next_live(entries, len(entries) - 1, -1) if entries else -1
+        if last >= 0:  # Checks if there are matched items
+            # The most expensive items sit at the end; the first of them came first in the inventory
+            first = self.next_live(entries, bisect.bisect_left(entries, (entries[last][0],)), 1)
+            item_id = entries[first][2]
+            return item_id, self.inventory[item_id]  # Returns the most expensive item
         else:
             return None  # Returns None if no match is found
 
-    def find_closest_alternative(self, selected_item_id, item_type, selected_price):
-        """Finds a different manufacturer with similar item type and closest price.""" 
-        today = datetime.datetime.now()  # Gets the current date and time
-        alternatives = []  # Initializes a list to store alternative items 
+    def next_live(self, entries, index, step, skip_id=None):
+        """Returns the index of the first entry from index on, moving by step, that has not expired
+        and is not of the skipped item, or an index outside the entries if there is none."""
+        expired = self.expired
+        while 0 <= index < len(entries) and (entries[index][1] in expired or entries[index][2] == skip_id):
+            index += step
+        return index
 
-        for item_id, item in self.inventory.items():  # Iterates through the inventory
-            # Checks if the item matches the item type, is not damaged, and is within service date
-            if item_id != selected_item_id and item['ItemType'].lower() == item_type.lower():
-                if not item['Damaged'] and item['ServiceDate'] > today:
-                    alternatives.append((item_id, item))  # Adds the item to the alternatives list
-
-        closest = None  # Initializes the closest alternative
-        min_price_diff = None  # Initializes the minimum price difference
+    def find_closest_alternative(self, selected_item_id, item_type, selected_price):
+        """Finds a different manufacturer with similar item type and closest price."""
+        self.refresh_query_index()  # Drops items that have passed their service date
+        entries = self.type_index.get(item_type.lower(), [])  # Looks up the items of this type
+        split = bisect.bisect_left(entries, (selected_price,))  # Finds the first item priced at or above the selected price
 
-        for item in alternatives:  # Iterates through the alternative items
-            price_diff = abs(item[1]['Price'] - selected_price)  # Calculates the price difference
-            if min_price_diff is None or price_diff < min_price_diff:  # Finds the closest price
-                min_price_diff = price_diff
-                closest = item
+        # Cheapest item at or above the selected price, skipping the selected item
+        above = self.next_live(entries, split, 1, selected_item_id)
 
-        return closest  # Returns the closest alternative
+        # Most expensive item under the selected price, skipping the selected item
+        below = self.next_live(entries, split - 1, -1, selected_item_id)
+        if below >= 0:  # Moves to the first item at that price
+            below = self.next_live(entries, bisect.bisect_left(entries, (entries[below][0],)), 1, selected_item_id)
 
-    def process_query(self, user_input):
-        """Processes user input for a query."""
+        closest = None  # Initializes the closest alternative
+        if above < len(entries):
+            closest = entries[above]
+        if below >= 0:
+            candidate = entries[below]
+            if closest is None:
+                closest = candidate
+            else:
+                above_diff = abs(closest[0] - selected_price)  # Calculates the price differences
+                below_diff = abs(candidate[0] - selected_price)
+                # Ties go to the item that came first in the inventory
+                if below_diff < above_diff or (below_diff == above_diff and candidate[1] < closest[1]):
+                    closest = candidate
+
+        if closest is None:
+            return None
+        return closest[2], self.inventory[closest[2]]  # Returns the closest alternative
+
+    def parse_query(self, user_input):
+        """Returns the manufacturers and item types named in the user input."""
         words = user_input.lower().split()  # Splits the user input into words
         manufacturers = []  # Initializes a list to store manufacturers
         item_types = []  # Initializes a list to store item types
-
-        for word in words:  # Iterates through the input words
-            for item in self.inventory.values():  # Iterates through the inventory
-                # Checks if the word matches a manufacturer or item type
-                if word == item['Manufacturer'].lower() and word not in manufacturers:
-                    manufacturers.append(word)
-                if word == item['ItemType'].lower() and word not in item_types:
-                    item_types.append(word)
-
-        if len(manufacturers) != 1 or len(item_types) != 1:  # Checks if there is exactly one match for each
-            print("No such item in inventory")  # Prints an error message
-            return
-
-        manufacturer = manufacturers[0]  # Gets the matched manufacturer
-        item_type = item_types[0]  # Gets the matched item type
-
+        unknown_words = []  # Words that are not in the vocabulary
+
+        position = 0
+        while position < len(words):  # Iterates through the input words
+            # Tries the longest phrase starting at this word first
+            for length in range(min(self.vocabulary_max_words, len(words) - position), 0, -1):
+                roles = self.vocabulary.get(' '.join(words[position:position + length]))
+                if roles:
+                    break
+            else:
+                roles, length = None, 1
+                unknown_words.append(words[position])
+            if roles:  # Records the manufacturer or item type, each only once
+                if 'manufacturer' in roles and roles['manufacturer'] not in manufacturers:
+                    manufacturers.append(roles['manufacturer'])
+                if 'item_type' in roles and roles['item_type'] not in item_types:
+                    item_types.append(roles['item_type'])
+            position += length
+
+        if not manufacturers or not item_types:  # Falls back to typo correction only for what is missing
+            corrected_manufacturers = []
+            corrected_item_types = []
+            for word in unknown_words:
+                roles = self.vocabulary.get(self.correct_typo(word), {})
+                if 'manufacturer' in roles and roles['manufacturer'] not in corrected_manufacturers:
+                    corrected_manufacturers.append(roles['manufacturer'])
+                if 'item_type' in roles and roles['item_type'] not in corrected_item_types:
+                    corrected_item_types.append(roles['item_type'])
+            manufacturers = manufacturers or corrected_manufacturers
+            item_types = item_types or corrected_item_types
+
+        return manufacturers, item_types
+
+    def price_entries(self, item_type=None):
+        """Returns the price-sorted index entries of the valid items of an item type, or of every type."""
+        self.refresh_query_index()  # Drops items that have passed their service date
+        if item_type is None:
+            return self.price_index
+        return self.type_index.get(item_type.lower(), [])
+
+    def date_entries(self, item_type=None):
+        """Returns the service-date-sorted index entries of the valid items of an item type, or of every type."""
+        self.refresh_query_index()  # Drops items that have passed their service date
+        if item_type is None:
+            return self.date_index
+        return self.type_date_index.get(item_type.lower(), [])
+
+    def entry_items(self, entries, start, stop):
+        """Yields (item ID, item) for the index entries in range(start, stop) of items not yet expired.
+
+        Items expired once the generator has been created are still yielded, so its results
+        stay those of the time it was created, however slowly it is advanced.
+        """
+        expired, count = self.expired, self.expiry_count
+        return self.live_entry_items(entries, start, stop, expired, count)
+
+    def live_entry_items(self, entries, start, stop, expired, count):
+        """Yields (item ID, item) for the index entries in range(start, stop) not expired by expiry count or earlier."""
+        for index in range(start, stop):
+            value, position, item_id = entries[index]
+            if expired.get(position, count + 1) > count:
+                yield item_id, self.inventory[item_id]
+
+    def items_in_price_range(self, min_price=None, max_price=None, item_type=None):
+        """Yields (item ID, item) for the valid items priced from min_price to max_price inclusive, cheapest first.
+
+        Either bound may be left out, and item_type limits the items to one type. Ties keep
+        inventory order. Items are looked up only as the generator is advanced.
+        """
+        entries = self.price_entries(item_type)
+        start = 0 if min_price is None else bisect.bisect_left(entries, (min_price,))
+        stop = len(entries) if max_price is None else bisect.bisect_right(entries, (max_price, float('inf')))
+        return self.entry_items(entries, start, stop)
+
+    def cheapest_items(self, count, item_type=None):
+        """Yields (item ID, item) for the count cheapest valid items, of one item type or of every type."""
+        entries = self.price_entries(item_type)
+        return itertools.islice(self.entry_items(entries, 0, len(entries)), max(count, 0))
+
+    def most_expensive_items(self, count, item_type=None):
+        """Yields (item ID, item) for the count most expensive valid items, of one item type or of every type.
+
+        Items of the same price come in inventory order, as in find_best_match.
+        """
+        entries = self.price_entries(item_type)
+        expired, expiry_count = self.expired, self.expiry_count
+        end = len(entries)
+        while count > 0 and end:
+            start = bisect.bisect_left(entries, (entries[end - 1][0],))  # First item of the highest remaining price
+            for item_id, item in self.live_entry_items(entries, start, end, expired, expiry_count):
+                yield item_id, item
+                count -= 1
+                if not count:
+                    break
+            end = start
+
+    def expiring_items(self, days, item_type=None):
+        """Yields (item ID, item) for the valid items whose service date falls within the next days days, soonest first."""
+        entries = self.date_entries(item_type)
+        now = self.clock()
+        start = bisect.bisect_right(entries, (now, float('inf')))  # Skips items whose service date has passed
+        stop = bisect.bisect_right(entries, (now + datetime.timedelta(days=days), float('inf')))
+        return self.entry_items(entries, start, stop)
+
+    def item_result(self, item_id, item):
+        """Returns the details of a matched item as a dictionary for query results."""
+        return {'item_id': item_id, 'manufacturer': item['Manufacturer'], 'item_type': item['ItemType'], 'price': item['Price']}
+
+    def resolve_query(self, manufacturer, item_type):
+        """Returns (match, alternative) item results for a manufacturer and item type, each possibly None."""
         result = self.find_best_match(manufacturer, item_type)  # Finds the best match
+        if not result:
+            return None, None
+        item_id, item = result
+        alternative = self.find_closest_alternative(item_id, item_type, item['Price'])  # Finds an alternative
+        return self.item_result(item_id, item), alternative and self.item_result(*alternative)
+
+    def query_result(self, user_input, key, answer):
+        """Returns the result of a query given its (manufacturer, item type) key, or None, and its answer."""
+        manufacturer, item_type = key or (None, None)
+        match, alternative = answer
+        return {'query': user_input, 'manufacturer': manufacturer, 'item_type': item_type,
+                'match': match, 'alternative': alternative}
+
+    def query_key(self, user_input):
+        """Returns the (manufacturer, item type) named in a query, or None unless exactly one of each is named."""
+        manufacturers, item_types = self.parse_query(user_input)  # Finds the manufacturers and item types named
+        if len(manufacturers) != 1 or len(item_types) != 1:
+            return None
+        return manufacturers[0], item_types[0]
+
+    def answer_query(self, user_input):
+        """Answers a query, returning a dictionary with the query, the manufacturer and item type
+        it names, and the best 'match' and closest-price 'alternative' (each None if there is none)."""
+        key = self.query_key(user_input)
+        return self.query_result(user_input, key, self.resolve_query(*key) if key else (None, None))
+
+    def answer_queries(self, lines):
+        """Answers an iterable of queries, one per line, yielding answer_query() results in order.
+
+        Each distinct query text is parsed once, and each (manufacturer, item type) group is
+        resolved once until the query indexes change, so the cost of a batch grows with the
+        number of distinct groups rather than the number of lines. Blank lines are skipped.
+        Results of the same group share their match and alternative dictionaries.
+        """
+        keys = {}  # Maps query text to its (manufacturer, item type), or None
+        answers = {}  # Maps (manufacturer, item type) to its (match, alternative)
+        generation = self.index_generation
+        for line in lines:
+            user_input = line.strip()
+            if not user_input:
+                continue
+            if user_input in keys:
+                key = keys[user_input]
+            else:
+                if len(keys) >= BATCH_MEMO_SIZE:  # Keeps memory bounded for batches of unique texts
+                    keys.clear()
+                key = keys[user_input] = self.query_key(user_input)
+            if key is None:
+                yield self.query_result(user_input, None, (None, None))
+                continue
+            self.refresh_query_index()  # Drops items that have passed their service date
+            if self.index_generation != generation:  # Answers resolved from the old indexes are stale
+                answers.clear()
+                generation = self.index_generation
+            answer = answers.get(key)
+            if answer is None:
+                answer = answers[key] = self.resolve_query(*key)
+            yield self.query_result(user_input, key, answer)
+
+    def process_query(self, user_input):
+        """Processes user input for a query."""
+        result = self.answer_query(user_input)  # Finds the best match and an alternative
+        match = result['match']
 
-        if result:  # Checks if a match is found
-            item_id, item = result  # Retrieves the matched item details
+        if match:  # Checks if a match is found
             # Prints the matched item details
-            print(f"Your item is: {item_id}, {item['Manufacturer']}, {item['ItemType']}, {item['Price']}")
-            alternative = self.find_closest_alternative(item_id, item_type, item['Price'])  # Finds an alternative
+            print(f"Your item is: {match['item_id']}, {match['manufacturer']}, {match['item_type']}, {match['price']}")
+            alternative = result['alternative']
             if alternative:  # Checks if an alternative is found
-                alt_id, alt_item = alternative  # Retrieves the alternative item details
                 # Prints the alternative item details
-                print(f"You may, also, consider: {alt_id}, {alt_item['Manufacturer']}, {alt_item['ItemType']}, {alt_item['Price']}")
+                print(f"You may, also, consider: {alternative['item_id']}, {alternative['manufacturer']}, {alternative['item_type']}, {alternative['price']}")
         else:
             print("No such item in inventory")  # Prints an error message if no match is found
+        return result
+
+def pages(results, page_size):
+    """Yields the results of a query lazily, as lists of at most page_size results."""
+    results = iter(results)
+    while True:
+        page = list(itertools.islice(results, page_size))
+        if not page:
+            return
+        yield page
+
+def instrument_manager(manager, profiler):
+    """Measures the report writers and query methods of a manager as stages of the profile."""
+    profiler.instrument(manager, "full_inventory", writes=["FullInventory.txt"])
+    profiler.instrument(manager, "item_type_inventory", writes=manager.item_type_files)
+    profiler.instrument(manager, "past_service_date_inventory", writes=["PastServiceDateInventory.txt"])
+    profiler.instrument(manager, "damaged_inventory", writes=["DamagedInventory.txt"])
+    for method_name in ("process_query", "find_best_match", "find_closest_alternative"):
+        profiler.instrument(manager, method_name)
+
+def run_batch(manager, filename):
+    """Answers the queries in a file ('-' for standard input) as JSON Lines on standard output."""
+    source = sys.stdin if filename == "-" else open(filename)
+    start = time.perf_counter()  # Times the answering alone, not the loading
+    count = 0
+    encoded = {}  # Maps (manufacturer, item type) to (match, alternative, encoded answer fields)
+    try:
+        for result in manager.answer_queries(source):
+            key = (result['manufacturer'], result['item_type'])
+            cached = encoded.get(key)
+            # Results of a group share their answer, so its fields are encoded once per answer
+            if cached is None or cached[0] is not result['match'] or cached[1] is not result['alternative']:
+                fields = {name: result[name] for name in ('manufacturer', 'item_type', 'match', 'alternative')}
+                cached = encoded[key] = (result['match'], result['alternative'], json.dumps(fields)[1:])
+            sys.stdout.write('{"query": ' + json.dumps(result['query']) + ", " + cached[2] + "\n")
+            count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+    # Reports the throughput on standard error, keeping standard output to the results
+    print(f"Answered {count} queries in {elapsed:.3f} s ({count / elapsed if elapsed else 0:.0f} queries per second)", file=sys.stderr)
+    return count
 
 def main():
-    manager = InventoryManager()  # Creates an instance of the InventoryManager class
-
-    # Reads the input files and processes the inventory
-    manufacturer_list = manager.read_file("ManufacturerList.txt")
-    price_list = manager.read_file("PriceList.txt")
-    service_dates_list = manager.read_file("ServiceDatesList.txt")
-    manager.process_inventory(manufacturer_list, price_list, service_dates_list)
-
-    # Generates the inventory reports
-    manager.full_inventory()
-    manager.item_type_inventory()
-    manager.past_service_date_inventory()
-    manager.damaged_inventory()
+    parser = argparse.ArgumentParser(description="Writes the inventory reports and answers queries.")  # Reads the command line options
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes read from an input file at a time")
+    parser.add_argument("--incremental", nargs="?", const=".part2_snapshot.pickle", metavar="SNAPSHOT", help="apply input file changes to the snapshot of the last run and rewrite only the affected reports")
+    parser.add_argument("--snapshot", nargs="?", const=".part2_inventory.snapshot", metavar="SNAPSHOT", help="start from a memory-mapped snapshot of the processed inventory while the input files are unchanged")
+    parser.add_argument("--batch", metavar="FILE", help="answer the queries in FILE ('-' for standard input), one per line, as JSON Lines instead of prompting")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes used to write the reports")
+    parser.add_argument("--storage", choices=("dict", "columnar"), default="dict", help="how the inventory is held in memory")
+    parser.add_argument("--profile", metavar="FILE", help="write the wall and CPU time, rows, bytes and allocations of each stage and query method to FILE on exit")
+    parser.add_argument("--profile-format", choices=("json", "prometheus"), default="json", help="format of the --profile file")
+    parser.add_argument("--profile-capture", choices=("cprofile", "tracemalloc"), help="also profile the slowest stage, saved as FILE.<stage>.pstats or FILE.<stage>.tracemalloc.txt")
+    args = parser.parse_args()
+
+    # Creates an instance of the InventoryManager class
+    manager = InventoryManager(ColumnarInventory() if args.storage == "columnar" else None)
+
+    profiler = StageProfiler("part2", bool(args.profile), args.profile_capture)  # Measures each stage when --profile is given
+    instrument_manager(manager, profiler)
+    try:
+        run_session(manager, args, profiler)
+    finally:
+        if args.profile:
+            profiler.write(args.profile, args.profile_format)  # Writes the measurements, and any capture beside them
+
+def run_session(manager, args, profiler):
+    """Loads the inventory, writes the reports and answers queries as the command line options ask."""
+    report_date = None
+    if args.snapshot:
+        with profiler.stage("open_snapshot", reads=[args.snapshot]):
+            report_date = manager.open_snapshot(args.snapshot)
+    if report_date is not None:  # The reports were written with the snapshot
+        today = manager.clock()
+        if report_date != today.date():  # Service dates may have passed since then
+            manager.past_service_date_inventory()
+            with profiler.stage("save_snapshot"):
+                manager.save_snapshot(args.snapshot, source_stats())  # Records the new report date
+        else:  # The report written today is current
+            manager.track_past_service_date(today)
+    else:
+        sources = source_stats()  # Taken first, so that a file changed while loading invalidates the snapshot
+        if args.incremental:  # Applies only what changed since the last run
+            with profiler.stage("load_incremental", reads=INPUT_FILES) as record:
+                manager.load_incremental(args.incremental, ColumnarInventory if args.storage == "columnar" else dict)
+                record['rows'] = len(manager.inventory)
+        else:
+            # Streams the input files and processes the inventory
+            with profiler.stage("load_inventory", reads=INPUT_FILES) as record:
+                manager.load_inventory(args.chunk_size)
+                record['rows'] = len(manager.inventory)
+
+            # Generates the inventory reports
+            if args.jobs > 1:
+                with profiler.stage("write_reports_in_parallel", writes=lambda: list(REPORT_FILES) + manager.item_type_files()):
+                    manager.write_reports(args.jobs)
+            else:
+                manager.write_reports(args.jobs)
+
+        if args.snapshot:  # Lets the next session skip loading
+            with profiler.stage("save_snapshot"):
+                manager.save_snapshot(args.snapshot, sources)
+
+    if args.batch:  # Answers a file of queries instead of prompting
+        with profiler.stage("answer_batch") as record:
+            record['rows'] = run_batch(manager, args.batch)
+        manager.update_past_service_date_report()  # Adds the items whose service date passed during the batch
+        return
 
     while True:  # Loops to process user queries
         user_input = input("\nPlease enter manufacturer and item type (or 'q' to quit): ")  # Prompts the user
         if user_input.lower() == 'q':  # Checks if the user wants to quit
             break  # Exits the loop
         manager.process_query(user_input)  # Processes the user query
+        manager.update_past_service_date_report()  # Adds the items whose service date has passed since
 
     print("Thank you for using the Inventory System!")  # Prints a thank-you message
 
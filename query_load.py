@@ -0,0 +1,99 @@
+"""Load generator for query_server.py.
+
+Sends the queries of a file, one per line, over a number of keep-alive connections at once,
+and reports the requests per second and the p50 and p99 latencies.
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import time
+from urllib.parse import quote_plus
+
+from query_server import DEFAULT_HOST, DEFAULT_PORT
+
+
+def percentile(sorted_values, fraction):
+    """Returns the nearest-rank percentile of a sorted list, or 0.0 if it is empty."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+async def read_response(reader):
+    """Reads one response and returns its status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("the server closed the connection")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def run_connection(host, port, queries, first, count, latencies, errors):
+    """Sends count requests over one connection, starting at query number first."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for number in range(first, first + count):
+            request = f"GET /query?q={quote_plus(queries[number % len(queries)])} HTTP/1.1\r\nHost: {host}\r\n\r\n"
+            start = time.perf_counter()
+            writer.write(request.encode())
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def generate_load(host, port, queries, requests, concurrency):
+    """Sends the requests and returns (latencies in seconds, error statuses, elapsed seconds)."""
+    latencies = []
+    errors = []
+    share, extra = divmod(requests, concurrency)  # Requests sent over each connection
+    start = time.perf_counter()
+    tasks = []
+    first = 0
+    for connection in range(concurrency):
+        count = share + (connection < extra)
+        tasks.append(run_connection(host, port, queries, first, count, latencies, errors))
+        first += count
+    await asyncio.gather(*tasks)
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency and throughput of query_server.py.")
+    parser.add_argument("queries", help="file of queries, one per line")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address of the server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port of the server")
+    parser.add_argument("--requests", type=int, default=10000, help="total requests to send")
+    parser.add_argument("--concurrency", type=int, default=50, help="connections sending requests at once")
+    args = parser.parse_args()
+
+    with open(args.queries) as file:
+        queries = [line.strip() for line in file if line.strip()]
+    if not queries:
+        sys.exit(f"{args.queries} holds no queries")
+    concurrency = max(1, min(args.concurrency, args.requests))
+
+    latencies, errors, elapsed = asyncio.run(generate_load(args.host, args.port, queries, args.requests, concurrency))
+    latencies.sort()
+    print(f"{len(latencies)} requests over {concurrency} connections in {elapsed:.3f} s")
+    print(f"throughput: {len(latencies) / elapsed if elapsed else 0:.0f} requests per second")
+    print(f"latency: p50 {percentile(latencies, 0.50) * 1000:.3f} ms, p99 {percentile(latencies, 0.99) * 1000:.3f} ms")
+    if errors:
+        print(f"errors: {len(errors)} responses were not 200 OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Asyncio HTTP server answering inventory queries for many clients at once.
+
+    GET /query?q=dell+laptop   the InventoryManager.answer_query() result as JSON
+    POST /reload               loads the inventory again from the input files
+    GET /stats                 request and cache counters
+
+The inventory is loaded once at startup. Connections are kept alive between requests, and
+answers for recently asked (manufacturer, item type) pairs are kept in an LRU cache. Each
+entry expires after a fixed time, and the whole cache is dropped when the query indexes
+change (an indexed item has passed its service date) or the inventory is reloaded.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+from columnar_inventory import ColumnarInventory
+from part2 import DEFAULT_CHUNK_SIZE, InventoryManager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_SIZE = 4096  # (manufacturer, item type) answers kept in the cache
+DEFAULT_TTL = 60.0  # Seconds an answer stays in the cache
+MAX_HEADERS = 100  # Header lines accepted in a request
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class AnswerCache:
+    """LRU cache of query answers whose entries expire after ttl seconds.
+
+    Entries belong to one generation of the query indexes; asking with a different
+    generation empties the cache first. clock is injectable for testing.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.maxsize = maxsize  # Entries kept before the least recently used is evicted
+        self.ttl = ttl  # Seconds an entry stays valid
+        self.clock = clock  # Returns the current time in seconds
+        self.entries = OrderedDict()  # Maps key to (expiry time, answer), least recently used first
+        self.generation = None  # Index generation the entries were computed from
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        """Returns the cached answer for a key, or None if it is missing, expired or from another generation."""
+        if generation != self.generation:
+            self.invalidate()
+            self.generation = generation
+        entry = self.entries.get(key)
+        if entry is None or self.clock() >= entry[0]:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, answer):
+        """Caches an answer, evicting the least recently used entry if the cache is full."""
+        self.entries[key] = (self.clock() + self.ttl, answer)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drops every entry."""
+        self.entries.clear()
+        self.generation = None
+
+    def stats(self):
+        """Returns the size and hit counts of the cache."""
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def load_manager(snapshot=None, storage="dict", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns an InventoryManager loaded from a valid snapshot, or else from the input files."""
+    manager = InventoryManager(ColumnarInventory() if storage == "columnar" else None)
+    if snapshot and manager.open_snapshot(snapshot) is not None:
+        return manager
+    manager.load_inventory(chunk_size)
+    return manager
+
+
+class QueryServer:
+    """Answers HTTP query requests from an InventoryManager, caching answers by (manufacturer, item type)."""
+
+    def __init__(self, manager, cache, loader):
+        self.manager = manager  # Answers the queries; replaced as a whole on reload
+        self.cache = cache  # AnswerCache of (match, alternative) answers
+        self.loader = loader  # Returns a newly loaded InventoryManager
+        self.reload_lock = asyncio.Lock()  # Lets one reload run at a time
+        self.requests = 0
+
+    def answer(self, user_input):
+        """Returns the answer_query() result for a query, using the cache for its (manufacturer, item type)."""
+        manager = self.manager
+        key = manager.query_key(user_input)
+        if key is None:
+            return manager.query_result(user_input, None, (None, None))
+        manager.refresh_query_index()  # Drops items that have passed their service date
+        answer = self.cache.get(key, manager.index_generation)
+        if answer is None:
+            answer = manager.resolve_query(*key)
+            self.cache.put(key, answer)
+        return manager.query_result(user_input, key, answer)
+
+    async def reload(self):
+        """Loads the inventory again in a worker thread and switches to it once it is ready.
+
+        If loading fails, the error is raised and the old inventory stays in use.
+        """
+        async with self.reload_lock:
+            start = time.perf_counter()
+            manager = await asyncio.get_running_loop().run_in_executor(None, self.loader)
+            self.manager = manager  # Queries keep using the old inventory until here
+            self.cache.invalidate()
+            return {'items': len(manager.inventory), 'seconds': round(time.perf_counter() - start, 3)}
+
+    async def route(self, method, target):
+        """Returns (status, body) for a request."""
+        url = urlsplit(target)
+        if url.path == "/query":
+            if method != "GET":
+                return 405, {'error': "use GET"}
+            queries = parse_qs(url.query).get('q')
+            if not queries:
+                return 400, {'error': "missing q parameter"}
+            return 200, self.answer(queries[0])
+        if url.path == "/reload":
+            if method != "POST":
+                return 405, {'error': "use POST"}
+            return 200, await self.reload()
+        if url.path == "/stats":
+            return 200, {'requests': self.requests, 'items': len(self.manager.inventory), 'cache': self.cache.stats()}
+        return 404, {'error': f"no such path {url.path!r}"}
+
+    async def handle(self, reader, writer):
+        """Serves the requests of one connection until the client closes it or asks to."""
+        try:
+            while True:
+                headers = {}
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    for _ in range(MAX_HEADERS):
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:  # A line longer than the stream limit
+                    request_line = b""
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3 or not headers.get('content-length', '0').isdigit():
+                    status, body, keep_alive = 400, {'error': "malformed request"}, False
+                else:
+                    method, target, version = parts
+                    length = int(headers.get('content-length', '0'))
+                    if length:
+                        await reader.readexactly(length)  # Request bodies are not used
+                    self.requests += 1
+                    try:
+                        status, body = await self.route(method, target)
+                    except Exception as error:  # Answers instead of dropping the connection, e.g. a failed reload
+                        status, body = 500, {'error': f"{type(error).__name__}: {error}"}
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' or (version == "HTTP/1.1" and connection != 'close')
+
+                payload = json.dumps(body).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+
+async def serve(server, host, port):
+    """Runs the server until it is cancelled."""
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving {len(server.manager.inventory)} items on http://{host}:{port}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answers inventory queries over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="(manufacturer, item type) answers kept in the cache")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="seconds an answer stays in the cache")
+    parser.add_argument("--snapshot", metavar="SNAPSHOT", help="start from this part2.py --snapshot file while the input files are unchanged")
+    parser.add_argument("--storage", choices=("dict", "columnar"), default="dict", help="how the inventory is held in memory")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes read from an input file at a time")
+    args = parser.parse_args()
+
+    def loader():
+        return load_manager(args.snapshot, args.storage, args.chunk_size)
+
+    server = QueryServer(loader(), AnswerCache(args.cache_size, args.ttl), loader)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
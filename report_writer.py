@@ -0,0 +1,35 @@
+"""Buffered, atomic writing of the inventory report files."""
+
+import os
+
+BUFFER_SIZE = 1 << 20  # Bytes collected before each write to the disk
+
+
+def write_report(filename, lines, buffer_size=BUFFER_SIZE):
+    """Writes the lines to a report file so readers only ever see a complete report.
+
+    The lines go through a large write buffer into a temporary file in the same directory,
+    which then replaces the report in a single rename.
+    """
+    directory, name = os.path.split(filename)  # Keeps the temporary file on the same file system
+    temporary = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    try:
+        with open(temporary, 'w', buffering=buffer_size) as file:
+            file.writelines(lines)
+        os.replace(temporary, filename)  # Swaps the finished report in
+    except BaseException:
+        if os.path.exists(temporary):  # Leaves no partial file behind
+            os.remove(temporary)
+        raise
+
+
+def append_report(filename, lines):
+    """Appends the lines to the end of a report file in a single write.
+
+    The report is neither read nor rewritten, so the cost grows with the lines appended
+    rather than with the report.
+    """
+    text = "".join(lines)
+    if text:
+        with open(filename, 'a') as file:
+            file.write(text)
@@ -0,0 +1,58 @@
+"""Parsing and formatting of MM/DD/YYYY service dates.
+
+Service dates repeat heavily across an inventory, so both directions are memoized in bounded
+LRU caches, and so is the check of the input files. cache_stats() reports how often the caches
+were hit.
+"""
+
+import datetime
+from functools import lru_cache
+
+CACHE_SIZE = 1 << 14  # Distinct dates remembered in each direction
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_service_date(text):
+    """Converts an MM/DD/YYYY string into a datetime, as datetime.strptime(text, "%m/%d/%Y") would."""
+    parts = text.split('/')  # Splits the date into month, day and year
+    if (len(parts) != 3 or not all(part.isascii() and part.isdigit() for part in parts)
+            or not 1 <= len(parts[0]) <= 2 or not 1 <= len(parts[1]) <= 2 or len(parts[2]) != 4):
+        raise ValueError(f"time data {text!r} does not match format '%m/%d/%Y'")
+    return datetime.datetime(int(parts[2]), int(parts[0]), int(parts[1]))  # Rejects impossible days
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_service_date(date):
+    """Converts a date into an MM/DD/YYYY string, as date.strftime('%m/%d/%Y') would."""
+    return f"{date.month:02d}/{date.day:02d}/{date.year}"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def is_service_date(text):
+    """Checks whether the text is empty or a valid MM/DD/YYYY date.
+
+    The check keeps its own cache and parses without the parse cache, so the parse cache counts
+    only the conversions of the dates into the inventory.
+    """
+    if not text:
+        return True
+    try:
+        parse_service_date.__wrapped__(text)
+    except ValueError:
+        return False
+    return True
+
+
+def cache_stats():
+    """Returns the hit and miss counts of the check, parse and format caches."""
+    check = is_service_date.cache_info()
+    parse = parse_service_date.cache_info()
+    format = format_service_date.cache_info()
+    return {
+        'check_hits': check.hits,
+        'check_misses': check.misses,
+        'parse_hits': parse.hits,
+        'parse_misses': parse.misses,
+        'format_hits': format.hits,
+        'format_misses': format.misses,
+    }
@@ -0,0 +1,200 @@
+"""Stage-level measurements of the inventory pipeline, for the --profile option of part1.py and part2.py.
+
+Each stage records its wall-clock and CPU time, the rows it produced, the bytes of the input
+files it read and of the report files it wrote, and the net number of memory blocks it left
+allocated. Query methods are wrapped so that every call is added to the totals of that
+method. Stages may nest: a report written while loading incrementally is measured both on
+its own and as part of the load. The results, together with the service date cache
+counters, are written as JSON or as a Prometheus text exposition file.
+
+With a capture, every outermost stage also runs under cProfile or tracemalloc, and the
+profile or allocation statistics of the one with the longest wall-clock time are written
+next to the metrics file.
+"""
+
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from report_writer import write_report
+from service_dates import cache_stats
+
+CAPTURE_LINES = 30  # Allocation sites listed in a tracemalloc capture
+
+# Measurements of each stage in the Prometheus output, as inventory_stage_<key>, with their help text
+METRICS = (
+    ('calls', "Times the stage or query method ran."),
+    ('wall_seconds', "Wall-clock time spent in the stage."),
+    ('cpu_seconds', "CPU time of this process spent in the stage."),
+    ('rows', "Inventory items or report lines the stage produced."),
+    ('bytes_read', "Bytes of the input files the stage read."),
+    ('bytes_written', "Bytes of the report files the stage wrote."),
+    ('allocated_blocks', "Net change in allocated memory blocks over the stage."),
+    ('peak_bytes', "Peak traced memory during the stage (tracemalloc capture only)."),
+)
+
+
+def file_size(path):
+    """Returns the size of a file, or 0 if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def count_lines(path):
+    """Returns the number of lines in a file, or 0 if it does not exist."""
+    try:
+        with open(path, 'rb') as file:
+            return sum(block.count(b"\n") for block in iter(lambda: file.read(1 << 20), b""))
+    except OSError:
+        return 0
+
+
+class StageProfiler:
+    """Collects the measurements of pipeline stages and query methods.
+
+    A disabled profiler measures nothing, so the pipeline can use it unconditionally.
+    capture is None, 'cprofile' or 'tracemalloc'.
+    """
+
+    def __init__(self, program, enabled=True, capture=None):
+        self.program = program  # Name of the program being profiled, as a label
+        self.enabled = enabled
+        self.capture = capture if enabled else None
+        self.stages = {}  # Maps stage or method name to its measurements, in the order first seen
+        self.hottest = None  # (wall seconds, stage name, capture) of the slowest outermost stage so far
+        self.depth = 0  # Number of stages currently running
+        if self.capture == 'tracemalloc':
+            tracemalloc.start()
+
+    def record(self, name):
+        """Returns the measurements of a stage, creating them if needed."""
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0,
+                                 'bytes_read': 0, 'bytes_written': 0, 'allocated_blocks': 0}
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name, reads=(), writes=()):
+        """Measures the body of a with statement as one run of a stage.
+
+        reads and writes name the input and report files of the stage, or are functions
+        returning them once the stage is over. Their sizes are counted as bytes read and
+        written, and the lines of the reports as rows. The body may also add to the 'rows'
+        of the yielded measurements itself.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        record = self.record(name)
+        outermost = self.depth == 0  # Captures cannot nest, so only outermost stages are captured
+        profile = cProfile.Profile() if outermost and self.capture == 'cprofile' else None
+        if outermost and self.capture == 'tracemalloc':
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        self.depth += 1
+        blocks = sys.getallocatedblocks()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - start_wall
+            record['cpu_seconds'] += time.process_time() - start_cpu
+            record['wall_seconds'] += wall
+            record['allocated_blocks'] += sys.getallocatedblocks() - blocks
+            record['calls'] += 1
+            self.depth -= 1
+            # File sizes and report lines are counted after the timings are taken
+            reads = reads() if callable(reads) else reads
+            writes = writes() if callable(writes) else writes
+            record['bytes_read'] += sum(file_size(path) for path in reads)
+            record['bytes_written'] += sum(file_size(path) for path in writes)
+            record['rows'] += sum(count_lines(path) for path in writes)
+            if outermost and self.capture == 'tracemalloc':
+                record['peak_bytes'] = max(record.get('peak_bytes', 0), tracemalloc.get_traced_memory()[1] - traced)
+            if outermost and self.capture and (self.hottest is None or wall > self.hottest[0]):
+                self.hottest = (wall, name, profile or tracemalloc.take_snapshot())
+
+    def instrument(self, owner, method_name, reads=(), writes=()):
+        """Replaces a method of an object with a wrapper that measures each call as a run of a stage.
+
+        reads and writes are as for stage(), except that functions are given the arguments
+        of the call.
+        """
+        if not self.enabled:
+            return
+        method = getattr(owner, method_name)
+
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            with self.stage(method_name,
+                            (lambda: reads(*args, **kwargs)) if callable(reads) else reads,
+                            (lambda: writes(*args, **kwargs)) if callable(writes) else writes):
+                return method(*args, **kwargs)
+
+        setattr(owner, method_name, measured)
+
+    def report(self):
+        """Returns every measurement as a dictionary."""
+        return {
+            'program': self.program,
+            'stages': self.stages,
+            'service_date_cache': cache_stats(),
+            'hottest_stage': self.hottest[1] if self.hottest else None,
+        }
+
+    def prometheus_lines(self):
+        """Yields the measurements in the Prometheus text exposition format."""
+        for key, help_text in METRICS:
+            samples = [(name, record[key]) for name, record in self.stages.items() if key in record]
+            if not samples:
+                continue
+            metric = f"inventory_stage_{key}"
+            yield f"# HELP {metric} {help_text}\n"
+            yield f"# TYPE {metric} gauge\n"
+            for name, value in samples:
+                yield f'{metric}{{program="{self.program}",stage="{name}"}} {value}\n'
+        yield "# HELP inventory_service_date_cache_total Hits and misses of the service date caches.\n"
+        yield "# TYPE inventory_service_date_cache_total counter\n"
+        for key, value in cache_stats().items():
+            cache, result = key.split('_')
+            yield f'inventory_service_date_cache_total{{program="{self.program}",cache="{cache}",result="{result}"}} {value}\n'
+
+    def write(self, path, format='json'):
+        """Writes the measurements to a file as 'json' or 'prometheus', then any capture beside it.
+
+        Returns the path of the capture file, or None if there is none.
+        """
+        if not self.enabled:
+            return None
+        if format == 'prometheus':
+            write_report(path, self.prometheus_lines())
+        else:
+            write_report(path, [json.dumps(self.report(), indent=2), "\n"])
+        return self.write_capture(path)
+
+    def write_capture(self, path):
+        """Writes the cProfile or tracemalloc capture of the hottest stage beside the metrics file."""
+        if self.hottest is None:
+            return None
+        wall, name, captured = self.hottest
+        if self.capture == 'cprofile':
+            capture_path = f"{path}.{name}.pstats"
+            captured.dump_stats(capture_path)  # Read it with python -m pstats
+        else:
+            capture_path = f"{path}.{name}.tracemalloc.txt"
+            statistics = captured.statistics('lineno')[:CAPTURE_LINES]
+            write_report(capture_path, [f"Top allocation sites still held at the end of {name} ({wall:.3f} s)\n"]
+                         + [f"{statistic}\n" for statistic in statistics])
+        return capture_path
@@ -0,0 +1,173 @@
+"""Tests that a ColumnarInventory behaves as the dictionary of dictionaries it stands in for."""
+
+import datetime
+import itertools
+import pickle
+import random
+import unittest
+
+import part1
+from columnar_inventory import ColumnarInventory
+from inventory_views import ColumnarViews, InventoryViews, views_for
+
+TODAY = datetime.datetime(2026, 5, 1, 12)
+
+
+def random_item(generator):
+    """Returns random item details, sometimes without a price or service date."""
+    item = {'Manufacturer': generator.choice(["Dell", "Apple", "apple", "Big Co"]),
+            'ItemType': generator.choice(["laptop", "phone", "Tower"]),
+            'Damaged': generator.choice(["", "", "damaged", "cracked"])}
+    if generator.random() < 0.9:
+        item['Price'] = generator.choice([0, 5, 250, 250, 1200, -3])
+    if generator.random() < 0.9:
+        item['ServiceDate'] = datetime.datetime(2026, generator.randint(3, 7), generator.randint(1, 28))
+    return item
+
+
+def as_dicts(inventory):
+    """Returns the (item ID, details) pairs of an inventory, with plain dictionaries for details."""
+    return [(item_id, dict(item)) for item_id, item in inventory.items()]
+
+
+class ColumnarInventoryTest(unittest.TestCase):
+
+    def assert_same(self, store, expected):
+        self.assertEqual(len(store), len(expected))
+        self.assertEqual(list(store), list(expected))
+        self.assertEqual(as_dicts(store), list(expected.items()))
+
+    def test_random_changes_match_a_dictionary(self):
+        for seed in range(40):
+            generator = random.Random(seed)
+            text_ids = seed % 4 == 0  # Some runs switch to text IDs part way through
+            store, expected = ColumnarInventory(), {}
+            for step in range(300):
+                item_id = str(generator.randint(1, 60))
+                roll = generator.random()
+                if text_ids and step == 150:  # Adds an ID that cannot be stored as an integer
+                    item_id, roll = "A-" + item_id, 0.0
+                if roll < 0.5:
+                    item = random_item(generator)
+                    store[item_id] = item
+                    expected[item_id] = dict(item)
+                elif roll < 0.65:
+                    if item_id in expected:
+                        del store[item_id]
+                        del expected[item_id]
+                    else:
+                        with self.assertRaises(KeyError):
+                            del store[item_id]
+                elif roll < 0.8 and item_id in expected:  # Changes a field through the record
+                    record = store[item_id]
+                    if 'Price' in expected[item_id] and generator.random() < 0.3:
+                        del record['Price']
+                        del expected[item_id]['Price']
+                    else:
+                        record['Price'] = expected[item_id]['Price'] = generator.randint(1, 99)
+                    record['Damaged'] = expected[item_id]['Damaged'] = generator.choice(["", "damaged", "bent"])
+                else:
+                    self.assertEqual(item_id in store, item_id in expected)
+                    self.assertEqual(store.get(item_id) and dict(store.get(item_id)), expected.get(item_id))
+            self.assert_same(store, expected)
+
+    def test_missing_items_and_fields(self):
+        store = ColumnarInventory.from_inventory({"1": {'Manufacturer': "Dell", 'ItemType': "laptop", 'Damaged': ""}})
+        for item_id in ("2", "01", "x", "", "1.0"):
+            self.assertNotIn(item_id, store)
+            self.assertIsNone(store.get(item_id))
+            with self.assertRaises(KeyError):
+                store[item_id]
+        record = store["1"]
+        self.assertNotIn('Price', record)
+        self.assertEqual(record.get('Price', 'N/A'), 'N/A')
+        with self.assertRaises(KeyError):
+            record['ServiceDate']
+        with self.assertRaises(KeyError):
+            del record['Manufacturer']
+        self.assertTrue(store.integer_ids())
+
+    def test_ids_that_are_not_plain_integers_keep_their_text(self):
+        store = ColumnarInventory()
+        for item_id in ("12", "007", "0", "12345678901234567890", "x9"):
+            store[item_id] = {'Manufacturer': "Dell", 'ItemType': "laptop", 'Damaged': ""}
+        self.assertFalse(store.integer_ids())
+        self.assertEqual(list(store), ["12", "007", "0", "12345678901234567890", "x9"])
+        self.assertIn("007", store)
+        self.assertNotIn("7", store)
+
+    def test_many_items_are_merged_into_the_sorted_index(self):
+        store, expected = ColumnarInventory(), {}
+        for number in itertools.chain(range(9000, 0, -3), range(1, 9000, 3)):
+            store[str(number)] = expected[str(number)] = {'Manufacturer': "Dell", 'ItemType': "laptop", 'Damaged': "", 'Price': number}
+        for number in range(2, 9000, 30):
+            self.assertNotIn(str(number), store)
+        for number in range(1, 9000, 9):
+            del store[str(number)]
+            del expected[str(number)]
+        self.assert_same(store, expected)
+        self.assertEqual(store["4"]['Price'], 4)
+
+    def test_select_rows_match_filters_of_the_items(self):
+        generator = random.Random(3)
+        expected = {str(number): random_item(generator) for number in range(200)}
+        store = ColumnarInventory.from_inventory(expected)
+        for item_id in list(expected)[::7]:
+            del store[item_id]
+            del expected[item_id]
+        ids = lambda rows: [store.id_at(row) for row in rows]
+        self.assertEqual(ids(store.select_rows(manufacturer="Dell", item_type="phone")),
+                         [item_id for item_id, item in expected.items() if (item['Manufacturer'], item['ItemType']) == ("Dell", "phone")])
+        self.assertEqual(ids(store.select_rows(damaged=True)), [item_id for item_id, item in expected.items() if item['Damaged']])
+        self.assertEqual(ids(store.select_rows(min_price=5, max_price=250)),
+                         [item_id for item_id, item in expected.items() if 5 <= item.get('Price', -10) <= 250])
+        self.assertEqual(ids(store.select_rows(serviced_before=TODAY)),
+                         [item_id for item_id, item in expected.items() if item.get('ServiceDate') and item['ServiceDate'] < TODAY])
+        self.assertEqual(ids(store.select_rows(serviced_after=TODAY)),
+                         [item_id for item_id, item in expected.items() if item.get('ServiceDate') and item['ServiceDate'] > TODAY])
+        self.assertEqual(store.select_rows(manufacturer="Nokia"), [])
+
+    def test_round_trips(self):
+        generator = random.Random(5)
+        expected = {str(number): random_item(generator) for number in range(50)}
+        expected["9"]['ServiceDate'] = None  # An empty service date is kept as such
+        store = ColumnarInventory.from_inventory(expected)
+        del store["3"]
+        del expected["3"]
+        self.assert_same(pickle.loads(pickle.dumps(store)), expected)
+        self.assert_same(ColumnarInventory.from_inventory(store), expected)
+        self.assertEqual(dict(as_dicts(ColumnarInventory.from_inventory(store))), expected)
+
+    def test_views_write_the_same_lines_as_a_dictionary(self):
+        generator = random.Random(7)
+        for trial in range(20):
+            expected = {str(generator.randint(1, 10 ** 6)): random_item(generator) for _ in range(60)}
+            store = ColumnarInventory.from_inventory(expected)
+            for item_id in list(expected)[::5]:
+                del store[item_id]
+                del expected[item_id]
+            columnar, dictionary = views_for(store), views_for(expected)
+            self.assertIsInstance(columnar, ColumnarViews)
+            self.assertIsInstance(dictionary, InventoryViews)
+
+            def lines(views, line, selection):
+                return list(itertools.starmap(line, views.fields(selection)))
+
+            self.assertEqual(columnar.item_types(), dictionary.item_types())
+            self.assertEqual(columnar.by_manufacturer(), dictionary.by_manufacturer())
+            self.assertEqual(lines(columnar, part1.FullInventoryLine, columnar.full_by_manufacturer()),
+                             lines(dictionary, part1.FullInventoryLine, dictionary.full_by_manufacturer()))
+            for item_type in dictionary.item_types():
+                self.assertEqual(lines(columnar, part1.ItemTypeLine, columnar.for_item_type(item_type)),
+                                 lines(dictionary, part1.ItemTypeLine, dictionary.for_item_type(item_type)))
+            self.assertEqual(lines(columnar, part1.PastServiceDateLine, columnar.past_service_date(TODAY)),
+                             lines(dictionary, part1.PastServiceDateLine, dictionary.past_service_date(TODAY)))
+            self.assertEqual(lines(columnar, part1.DamagedLine, columnar.damaged_by_price()),
+                             lines(dictionary, part1.DamagedLine, dictionary.damaged_by_price()))
+            some = list(expected)[:10]
+            self.assertEqual(lines(columnar, part1.FullInventoryLine, columnar.selection(some)),
+                             lines(dictionary, part1.FullInventoryLine, dictionary.selection(some)))
+
+
+if __name__ == "__main__":
+    unittest.main()
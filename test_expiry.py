@@ -0,0 +1,169 @@
+"""Tests of the service date expiry of part2.py, driven by an injected clock."""
+
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from columnar_inventory import ColumnarInventory
+from inventory_snapshot import source_stats
+from part2 import DEFAULT_CHUNK_SIZE, InventoryManager, pages, run_session
+from stage_profiler import StageProfiler
+
+INPUT_FILES = ("ManufacturerList.txt", "PriceList.txt", "ServiceDatesList.txt")
+START = datetime.datetime(2026, 5, 1, 12)  # Before most service dates of the sample input files
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += datetime.timedelta(**delta)
+
+
+def laptops(count):
+    """Returns an inventory of Dell laptops whose service dates pass one day apart, cheapest first."""
+    midnight = START.replace(hour=0)
+    return {str(number): {'Manufacturer': 'Dell', 'ItemType': 'laptop', 'Damaged': '', 'Price': 100 + number,
+                          'ServiceDate': midnight + datetime.timedelta(days=1 + number)} for number in range(count)}
+
+
+class ExpiryTest(unittest.TestCase):
+    """Runs each test in a directory holding a copy of the sample input files."""
+
+    def setUp(self):
+        source = os.path.dirname(os.path.abspath(__file__))
+        self.directory = tempfile.mkdtemp()
+        for filename in INPUT_FILES:
+            shutil.copy(os.path.join(source, filename), self.directory)
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.clock = Clock()
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def fresh_manager(self, storage=None):
+        """Returns a manager that loads the input files now."""
+        manager = InventoryManager(storage, self.clock)
+        manager.load_inventory()
+        return manager
+
+    def read_report(self):
+        with open("PastServiceDateInventory.txt") as file:
+            return file.read()
+
+    def assert_matches_fresh(self, manager):
+        """Checks the indexes and the past service date report against a manager loaded now."""
+        manager.refresh_query_index()
+        manager.compact_indexes()  # Leaves out the expired entries, as a rebuild does
+        manager.update_past_service_date_report()
+        report = self.read_report()
+        fresh = self.fresh_manager()
+        for name in ('query_index', 'type_index'):
+            self.assertEqual({key: list(entries) for key, entries in getattr(manager, name).items()},
+                             {key: list(entries) for key, entries in getattr(fresh, name).items()}, name)
+        self.assertEqual(list(manager.price_index), list(fresh.price_index))
+        self.assertEqual(manager.index_valid_until, fresh.index_valid_until)
+        fresh.past_service_date_inventory()
+        self.assertEqual(report, self.read_report())
+
+    def run_part2(self, **options):
+        """Runs a part2.py session answering no queries, and returns its manager."""
+        with open("queries.txt", "w"):
+            pass
+        args = argparse.Namespace(snapshot=None, incremental=None, batch="queries.txt", jobs=1, storage="dict",
+                                  chunk_size=DEFAULT_CHUNK_SIZE)
+        for name, value in options.items():
+            setattr(args, name, value)
+        manager = InventoryManager(ColumnarInventory() if args.storage == "columnar" else None, self.clock)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            run_session(manager, args, StageProfiler("part2", False))
+        return manager
+
+    def test_expiry_matches_a_rebuild(self):
+        for storage in (None, ColumnarInventory()):
+            manager = self.fresh_manager(storage)
+            manager.past_service_date_inventory()
+            for days in (0, 30, 32, 60, 200):
+                self.clock.advance(days=days)
+                self.assert_matches_fresh(manager)
+            self.clock = Clock()
+
+    def test_paused_results_survive_expiry(self):
+        manager = InventoryManager(laptops(6), self.clock)
+        manager.index_inventory()
+        results = pages(manager.items_in_price_range(), 2)
+        first = next(results)
+        self.clock.advance(days=3)
+        manager.find_best_match('dell', 'laptop')  # Expires three of the laptops
+        self.assertEqual([item_id for page in [first] + list(results) for item_id, item in page],
+                         ['0', '1', '2', '3', '4', '5'])
+        self.assertEqual([entry[2] for entry in manager.price_index], ['3', '4', '5'])
+
+    def test_expired_entries_are_skipped_until_the_group_is_copied(self):
+        manager = InventoryManager(laptops(12), self.clock)
+        manager.index_inventory()
+        self.clock.advance(days=2)  # Expires the two cheapest laptops, too few to copy the groups
+        self.assertEqual(manager.find_closest_alternative('11', 'laptop', 100)[0], '2')
+        self.assertEqual(len(manager.price_index), 12)
+        self.assertEqual([item_id for item_id, item in manager.cheapest_items(2)], ['2', '3'])
+        self.assertEqual([item_id for item_id, item in manager.items_in_price_range(max_price=103)], ['2', '3'])
+        manager.compact_indexes()
+        self.assertEqual([entry[2] for entry in manager.price_index], [str(number) for number in range(2, 12)])
+
+    def test_reopened_snapshot_does_not_expire_items_again(self):
+        manager = InventoryManager(laptops(4), self.clock)
+        manager.index_inventory()
+        self.clock.advance(days=1)
+        manager.find_best_match('dell', 'laptop')
+        manager.save_snapshot("inventory.snapshot", source_stats())
+        reopened = InventoryManager(clock=self.clock)
+        self.assertIsNotNone(reopened.open_snapshot("inventory.snapshot"))
+        self.assertEqual(reopened.expiry.pop_due(), [])
+        self.clock.advance(days=1)
+        self.assertEqual(reopened.find_best_match('dell', 'laptop')[0], '3')
+        self.assertEqual([entry[2] for entry in reopened.price_index], ['2', '3'])
+
+    def test_parallel_reports_are_kept_current(self):
+        manager = self.run_part2(jobs=2)
+        self.clock.advance(days=62)
+        self.assert_matches_fresh(manager)
+
+    def test_same_day_snapshot_reports_are_kept_current(self):
+        for storage in ("dict", "columnar"):
+            self.run_part2(snapshot="inventory.snapshot", storage=storage)
+            written = os.stat("PastServiceDateInventory.txt").st_mtime_ns
+            self.clock.advance(hours=2)
+            manager = self.run_part2(snapshot="inventory.snapshot", storage=storage)
+            # The report was left as the first run wrote it
+            self.assertEqual(os.stat("PastServiceDateInventory.txt").st_mtime_ns, written)
+            self.clock.advance(days=62)
+            self.assert_matches_fresh(manager)
+            os.remove("inventory.snapshot")
+            self.clock = Clock()
+
+    def test_unchanged_incremental_reports_are_kept_current(self):
+        self.run_part2(incremental="inventory.pickle")
+        written = os.stat("PastServiceDateInventory.txt").st_mtime_ns
+        self.clock.advance(hours=2)
+        manager = self.run_part2(incremental="inventory.pickle")
+        # The report was left as the first run wrote it
+        self.assertEqual(os.stat("PastServiceDateInventory.txt").st_mtime_ns, written)
+        self.clock.advance(days=62)
+        self.assert_matches_fresh(manager)
+
+
+if __name__ == "__main__":
+    unittest.main()
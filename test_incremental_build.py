@@ -0,0 +1,219 @@
+"""Tests of the incremental rebuilds of incremental_build.py, checked against full runs of part1.py."""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import part1
+from columnar_inventory import ColumnarInventory
+from incremental_build import SOURCES, IncrementalBuild
+
+SNAPSHOT = "inventory.pickle"
+
+MANUFACTURERS = [
+    "1167234,Apple,phone",
+    "2390112,Dell,laptop",
+    "9034210,Dell,tower",
+    "7346234,Lenovo,laptop,damaged",
+    "3001265,Samsung,phone",
+    "2347800,Apple,laptop",
+]
+PRICES = ["3001265,1200", "2347800,999", "2390112,799", "1167234,534", "9034210,345", "7346234,239"]
+SERVICE_DATES = ["9034210,5/27/2020", "2390112,7/2/2099", "2347800,7/3/2099", "7346234,9/1/2020",
+                 "1167234,2/1/2099", "3001265,11/1/2099"]
+
+
+class IncrementalBuildTest(unittest.TestCase):
+    """Keeps each input file in a list of lines, and runs part1.py on them in two directories:
+    incrementally in one, and from scratch in the other."""
+
+    STORAGE = "dict"  # The --storage of every run
+    INVENTORY = dict  # The inventory store of that storage
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.incremental = os.path.join(self.directory, "incremental")
+        self.full = os.path.join(self.directory, "full")
+        os.mkdir(self.incremental)
+        os.mkdir(self.full)
+        self.lines = {"ManufacturerList.txt": list(MANUFACTURERS), "PriceList.txt": list(PRICES),
+                      "ServiceDatesList.txt": list(SERVICE_DATES)}
+        self.write_inputs()
+        self.run_part1()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_inputs(self, *filenames):
+        """Writes the given input files, or all of them, to both directories."""
+        for filename in filenames or self.lines:
+            for directory in (self.incremental, self.full):
+                with open(os.path.join(directory, filename), 'w') as file:
+                    file.writelines(f"{line}\n" for line in self.lines[filename])
+
+    def append(self, filename, line):
+        """Appends a line to an input file, leaving the start of the file as it was."""
+        self.lines[filename].append(line)
+        for directory in (self.incremental, self.full):
+            with open(os.path.join(directory, filename), 'a') as file:
+                file.write(f"{line}\n")
+
+    def run_part1(self):
+        """Runs part1.py incrementally and from scratch, and checks that they wrote the same reports."""
+        for directory, options in ((self.incremental, ["--incremental", SNAPSHOT]), (self.full, [])):
+            options += ["--storage", self.STORAGE]
+            previous_directory, previous_argv = os.getcwd(), sys.argv
+            os.chdir(directory)
+            sys.argv = ["part1.py"] + options
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    part1.main()
+            finally:
+                os.chdir(previous_directory)
+                sys.argv = previous_argv
+        reports = sorted(filename for filename in os.listdir(self.full) if filename.endswith("Inventory.txt"))
+        self.assertEqual(reports, sorted(filename for filename in os.listdir(self.incremental)
+                                         if filename.endswith("Inventory.txt")))
+        for filename in reports:
+            with open(os.path.join(self.full, filename)) as full, open(os.path.join(self.incremental, filename)) as incremental:
+                self.assertEqual(incremental.read(), full.read(), filename)
+
+    def load(self):
+        """Returns the inventory and ReportChanges of the next incremental run, without saving them."""
+        build = IncrementalBuild(os.path.join(self.incremental, SNAPSHOT), self.incremental, self.INVENTORY)
+        inventory, changes = build.load()
+        with working_directory(self.full):
+            self.assertEqual([(item_id, dict(item)) for item_id, item in inventory.items()],
+                             [(item_id, dict(item)) for item_id, item in part1.LoadTheInventory(self.INVENTORY()).items()])
+        return inventory, changes
+
+    def scan(self, kind):
+        """Scans one input file against the saved snapshot; returns (changed item IDs, whether it was read whole)."""
+        build = IncrementalBuild(os.path.join(self.incremental, SNAPSHOT), self.incremental)
+        snapshot = build.read_snapshot()
+        for source_kind, filename, field_count in SOURCES:
+            if source_kind == kind:
+                state, changed, whole = build.scan(kind, filename, field_count, snapshot['states'][kind], snapshot['rows'][kind])
+                return list(changed), whole
+
+    def replace(self, filename, item_id, line):
+        """Replaces the line of an item ID in an input file, or removes it when line is None."""
+        lines = self.lines[filename]
+        position = [existing.split(',')[0] for existing in lines].index(item_id)
+        if line is None:
+            del lines[position]
+        else:
+            lines[position] = line
+        self.write_inputs(filename)
+
+    def test_unchanged_files_are_not_read(self):
+        self.assertEqual(self.scan('prices'), ([], False))
+        inventory, changes = self.load()
+        self.assertFalse(changes.full_inventory or changes.item_types or changes.past_service_date or changes.damaged)
+
+    def test_edited_price(self):
+        self.replace("PriceList.txt", "2347800", "2347800,1001")
+        self.assertEqual(self.scan('prices'), (["2347800"], True))  # Diffed row by row
+        inventory, changes = self.load()
+        self.assertTrue(changes.full_inventory)
+        self.assertEqual(changes.item_types, {"laptop"})
+        self.assertFalse(changes.damaged or changes.past_service_date)
+        self.run_part1()
+
+    def test_appended_price_is_read_from_the_last_offset(self):
+        self.append("PriceList.txt", "2347800,1001")
+        self.assertEqual(self.scan('prices'), (["2347800"], False))
+        inventory, changes = self.load()
+        self.assertEqual(changes.item_types, {"laptop"})
+        self.run_part1()
+
+    def test_appended_item(self):
+        self.append("ManufacturerList.txt", "5550001,Zeta,watch")
+        self.append("PriceList.txt", "5550001,77")
+        self.append("ServiceDatesList.txt", "5550001,1/2/2020")
+        inventory, changes = self.load()
+        self.assertEqual(list(inventory)[-1], "5550001")
+        self.assertEqual(changes.item_types, {"watch"})
+        self.assertTrue(changes.past_service_date)
+        self.run_part1()
+
+    def test_deleted_item(self):
+        self.replace("ManufacturerList.txt", "7346234", None)
+        inventory, changes = self.load()
+        self.assertNotIn("7346234", inventory)
+        self.assertTrue(changes.damaged and changes.past_service_date)
+        self.run_part1()
+
+    def test_reordered_items_rebuild_the_inventory(self):
+        lines = self.lines["ManufacturerList.txt"]
+        lines[0], lines[-1] = lines[-1], lines[0]
+        self.write_inputs("ManufacturerList.txt")
+        self.assertEqual(self.scan('manufacturers'), ([], True))  # The same rows in another order
+        inventory, changes = self.load()
+        self.assertIsNone(changes.item_types)  # Every report is written again
+        self.run_part1()
+
+    def test_changed_item_type(self):
+        self.replace("ManufacturerList.txt", "2347800", "2347800,Apple,phone")
+        inventory, changes = self.load()
+        self.assertEqual(changes.item_types, {"laptop", "phone"})
+        self.run_part1()
+        self.replace("ManufacturerList.txt", "9034210", "9034210,Dell,laptop")
+        inventory, changes = self.load()
+        self.assertEqual(changes.item_types, {"laptop"})  # No tower is left to write a file for
+        self.run_part1()
+
+    def test_changed_damage(self):
+        self.replace("ManufacturerList.txt", "1167234", "1167234,Apple,phone,damaged")
+        inventory, changes = self.load()
+        self.assertTrue(changes.damaged)
+        self.assertEqual(changes.item_types, {"phone"})
+        self.run_part1()
+
+    def test_edited_service_date(self):
+        self.replace("ServiceDatesList.txt", "2390112", "2390112,7/2/2020")
+        inventory, changes = self.load()
+        self.assertTrue(changes.past_service_date)
+        self.run_part1()
+
+    def test_removed_service_date(self):
+        self.replace("ServiceDatesList.txt", "9034210", None)
+        self.assertEqual(self.scan('service_dates'), (["9034210"], True))
+        inventory, changes = self.load()
+        self.assertNotIn('ServiceDate', inventory["9034210"])
+        self.assertTrue(changes.past_service_date)
+        self.run_part1()
+
+    def test_several_runs_in_a_row(self):
+        self.append("PriceList.txt", "1167234,600")
+        self.run_part1()
+        self.replace("ManufacturerList.txt", "3001265", None)
+        self.run_part1()
+        self.append("ManufacturerList.txt", "3001265,Samsung,tablet")
+        self.run_part1()
+
+
+class ColumnarIncrementalBuildTest(IncrementalBuildTest):
+    """Runs the same changes with the inventory kept in a ColumnarInventory."""
+
+    STORAGE = "columnar"
+    INVENTORY = ColumnarInventory
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Runs the body of a with statement in another directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
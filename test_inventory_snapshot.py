@@ -0,0 +1,143 @@
+"""Tests of the binary snapshot files of inventory_snapshot.py."""
+
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from columnar_inventory import ColumnarInventory
+from inventory_snapshot import MAGIC, SOURCES, TextIds, open_snapshot, save_snapshot, source_stats
+from part2 import InventoryManager
+
+TODAY = datetime.datetime(2026, 5, 1, 12)
+
+
+def random_inventory(generator, count, item_id):
+    """Returns an inventory of count random items, named by item_id(number)."""
+    inventory = {}
+    for number in range(count):
+        item = {'Manufacturer': generator.choice(["Dell", "Apple", "Big Co"]),
+                'ItemType': generator.choice(["laptop", "phone"]),
+                'Damaged': generator.choice(["", "", "damaged", "cracked"])}
+        if generator.random() < 0.9:
+            item['Price'] = generator.randint(1, 20)
+        if generator.random() < 0.9:
+            item['ServiceDate'] = datetime.datetime(generator.choice([2020, 2030]), 1, generator.randint(1, 5))
+        inventory[item_id(number)] = item
+    return inventory
+
+
+def entries(index):
+    """Returns the entries of a query index as lists, by group key for a dictionary of groups."""
+    if isinstance(index, dict):
+        return {key: list(group) for key, group in index.items()}
+    return list(index)
+
+
+class InventorySnapshotTest(unittest.TestCase):
+    """Runs each test in an empty directory, where the input files of a snapshot are missing."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, inventory):
+        """Saves an indexed inventory to a snapshot and returns the saving and the reopened managers."""
+        saved = InventoryManager(inventory, lambda: TODAY)
+        saved.index_inventory()
+        saved.save_snapshot("inventory.snapshot", source_stats())
+        reopened = InventoryManager(clock=lambda: TODAY)
+        self.assertEqual(reopened.open_snapshot("inventory.snapshot"), TODAY.date())
+        return saved, reopened
+
+    def assert_same_answers(self, saved, reopened):
+        items = lambda inventory: [(item_id, dict(item)) for item_id, item in inventory.items()]
+        self.assertEqual(items(reopened.inventory), items(saved.inventory))
+        for name in saved.index_tables():
+            self.assertEqual(entries(getattr(reopened, name)), entries(getattr(saved, name)), name)
+        for manufacturer in ("dell", "apple", "big co", "nokia"):
+            for item_type in ("laptop", "phone"):
+                match = saved.find_best_match(manufacturer, item_type)
+                self.assertEqual(reopened.find_best_match(manufacturer, item_type), match)
+                if match:
+                    self.assertEqual(reopened.find_closest_alternative(match[0], item_type, match[1]['Price']),
+                                     saved.find_closest_alternative(match[0], item_type, match[1]['Price']))
+
+    def test_integer_ids_round_trip(self):
+        inventory = random_inventory(random.Random(1), 300, lambda number: str(1000 + number * 7 % 300))
+        saved, reopened = self.round_trip(inventory)
+        self.assertTrue(reopened.inventory.integer_ids())
+        self.assert_same_answers(saved, reopened)
+
+    def test_text_ids_are_mapped_and_decoded_on_access(self):
+        names = ["B-7", "a", "007", "x" * 40, "café-9", "A-7", "①"]
+        inventory = random_inventory(random.Random(2), 200, lambda number: f"{names[number % len(names)]}{number}")
+        saved, reopened = self.round_trip(inventory)
+        store = reopened.inventory
+        self.assertIsInstance(store.item_ids, TextIds)
+        self.assertEqual(list(store.item_ids), list(inventory))
+        self.assertEqual(list(store.sorted_ids), sorted(inventory))
+        for item_id in inventory:
+            self.assertIn(item_id, store)
+        for item_id in ("a", "B-71", "7", "café"):
+            self.assertNotIn(item_id, store)
+        self.assert_same_answers(saved, reopened)
+        with open("inventory.snapshot", 'rb') as file:
+            self.assertNotIn(b'"007', file.read(4096))  # The IDs are not in the header
+
+    def test_resaving_a_mapped_snapshot(self):
+        for item_id in (str, lambda number: f"id-{number}"):
+            inventory = random_inventory(random.Random(3), 50, item_id)
+            saved, reopened = self.round_trip(inventory)
+            reopened.save_snapshot("again.snapshot", source_stats())
+            again = InventoryManager(clock=lambda: TODAY)
+            self.assertIsNotNone(again.open_snapshot("again.snapshot"))
+            self.assert_same_answers(saved, again)
+
+    def test_deleted_rows_are_left_out(self):
+        store = ColumnarInventory.from_inventory(random_inventory(random.Random(4), 30, str))
+        for item_id in ("0", "7", "29"):
+            del store[item_id]
+        saved, reopened = self.round_trip(store)
+        self.assertEqual(len(reopened.inventory.live), 27)
+        self.assert_same_answers(saved, reopened)
+
+    def test_empty_inventory(self):
+        saved, reopened = self.round_trip({})
+        self.assertEqual(len(reopened.inventory), 0)
+        self.assertIsNone(reopened.find_best_match("dell", "laptop"))
+
+    def test_stale_or_foreign_files_are_ignored(self):
+        save_snapshot("inventory.snapshot", {}, {}, None, source_stats(), TODAY.date())
+        self.assertIsNotNone(open_snapshot("inventory.snapshot"))
+        with open(SOURCES[0], 'w') as file:  # An input file appeared since the snapshot was written
+            file.write("1,Dell,laptop\n")
+        self.assertIsNone(open_snapshot("inventory.snapshot"))
+        self.assertIsNone(open_snapshot("missing.snapshot"))
+        with open("other.snapshot", 'wb') as file:
+            file.write(b"INVSNAP1" + bytes(64))
+        self.assertIsNone(open_snapshot("other.snapshot"))
+        self.assertNotEqual(MAGIC, b"INVSNAP1")
+
+    def test_text_ids_sequence(self):
+        offsets, text = TextIds.encode(["b", "", "été", "a"])
+        ids = TextIds(memoryview(offsets), memoryview(text))
+        self.assertEqual(len(ids), 4)
+        self.assertEqual((ids[0], ids[1], ids[2], ids[-1]), ("b", "", "été", "a"))
+        self.assertEqual(ids[1:3], ["", "été"])
+        with self.assertRaises(IndexError):
+            ids[4]
+        ordered = TextIds(offsets, text, array('q', [1, 3, 0, 2]))
+        self.assertEqual(list(ordered), ["", "a", "b", "été"])
+
+
+if __name__ == "__main__":
+    unittest.main()